@@ -1,10 +1,14 @@
 
 # app.py
+import os
+import json
 import streamlit as st
 from datetime import datetime
-from utils.chatbot_utils import chatbot_page
-from utils.rag_utils import rag_reader_page
 from utils.db import init_db, add_user, check_password, get_user, update_password
+from utils.warmup import start_warmup
+from utils.metrics import METRICS_ENABLED, get_metrics, start_metrics_server, to_prometheus
+# The chatbot / RAG pages (groq, sentence-transformers, torch, faiss) are imported
+# lazily below, so the login page renders without loading the ML stack.
 
 # Optional: JWT Token Support
 import jwt
@@ -12,6 +16,7 @@ import datetime as dt
 
 SECRET_KEY = "CHANGE_THIS_TO_A_STRONG_KEY"  # Move this to st.secrets or environment variables in production
 SESSION_TIMEOUT_MINUTES = 30  # session validity time
+ADMIN_USERS = {u.strip() for u in os.getenv("SMARTAI_ADMIN_USERS", "").split(",") if u.strip()}
 
 # -------------------------
 # JWT Token Functions
@@ -48,11 +53,34 @@ def logout_user(message="Logged out successfully."):
     st.warning(message)
     st.rerun()
 
+# -------------------------
+# Admin Metrics Panel (SMARTAI_METRICS=1)
+# -------------------------
+def metrics_panel():
+    snapshot = get_metrics().snapshot()
+    with st.sidebar.expander("📈 Metrics"):
+        rows = [{"stage": name, "count": s["count"],
+                 **{f"{q} ms": round(s[q] * 1000, 1) for q in ("p50", "p95", "p99", "max")}}
+                for name, s in snapshot["stages"].items()]
+        if rows:
+            st.dataframe(rows, hide_index=True)
+        else:
+            st.caption("No timings recorded yet.")
+        st.json(snapshot["counters"], expanded=False)
+        st.download_button("📥 metrics.json", json.dumps(snapshot, indent=2), file_name="metrics.json",
+                           mime="application/json")
+        st.download_button("📥 metrics.prom", to_prometheus(snapshot), file_name="metrics.prom",
+                           mime="text/plain")
+        if st.button("🔄 Reset Metrics"):
+            get_metrics().reset()
+            st.rerun()
+
 # -------------------------
 # Initialize App
 # -------------------------
 st.set_page_config(page_title="Smart AI Assistant", layout="wide")
 init_db()  # Initialize SQLite database
+start_metrics_server()  # GET /metrics on SMARTAI_METRICS_PORT (no-op unless enabled)
 
 # Run timeout check at the top
 check_session_timeout()
@@ -159,11 +187,17 @@ elif st.session_state.logged_in and choice == "Home":
 # -------------------------
 # PROTECTED PAGES
 # -------------------------
+if st.session_state.logged_in:
+    start_warmup()  # preload the embedding model in the background (once per process)
+    if METRICS_ENABLED and st.session_state.username in ADMIN_USERS:
+        metrics_panel()
+
 if st.session_state.get("page") == "chatbot":
     token_user = verify_token(st.session_state.get("token"))
     if not token_user:
         logout_user("⏳ Session expired. Please log in again.")
     else:
+        from utils.chatbot_utils import chatbot_page
         chatbot_page(st.session_state.username)
 
 elif st.session_state.get("page") == "rag":
@@ -171,6 +205,7 @@ elif st.session_state.get("page") == "rag":
     if not token_user:
         logout_user("⏳ Session expired. Please log in again.")
     else:
+        from utils.rag_utils import rag_reader_page
         rag_reader_page()
 
 
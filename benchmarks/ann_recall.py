@@ -0,0 +1,80 @@
+# benchmarks/ann_recall.py
+"""Recall@k vs latency of the ANN index backends against the exact Flat baseline.
+
+Usage (from the project root):
+    python -m benchmarks.ann_recall --n 100000 --dim 384 --queries 500 --k 5
+    python -m benchmarks.ann_recall --n 200000 --json ann_report.json
+"""
+import argparse
+import json
+import time
+import numpy as np
+from utils.rag_pdf_utils import build_faiss_index, search_index
+
+NPROBE_SWEEP = [1, 4, 16, 64]
+EF_SEARCH_SWEEP = [16, 32, 64, 128, 256]
+
+
+def synthetic_embeddings(n, dim, n_clusters=256, seed=0):
+    """Clustered unit vectors, closer to sentence embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype("float32")
+    labels = rng.integers(0, n_clusters, size=n)
+    data = centers[labels] + 0.35 * rng.standard_normal((n, dim)).astype("float32")
+    return data.astype("float32")
+
+
+def run_queries(index, queries, k, **params):
+    ids = np.empty((len(queries), k), dtype="int64")
+    start = time.perf_counter()
+    for i, q in enumerate(queries):
+        _, ids[i] = search_index(index, q[None, :].copy(), top_k=k, **params)
+    elapsed = time.perf_counter() - start
+    return ids, elapsed / len(queries) * 1000
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100_000, help="number of chunk vectors")
+    parser.add_argument("--dim", type=int, default=384, help="embedding dimension (MiniLM = 384)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    data = synthetic_embeddings(args.n, args.dim)
+    queries = synthetic_embeddings(args.queries, args.dim, seed=1)
+
+    rows = []
+    flat, _ = build_faiss_index(data.copy(), "flat")
+    truth, flat_ms = run_queries(flat, queries, args.k)
+    rows.append({"mode": "flat", "param": "-", "build_s": 0.0, "recall": 1.0, "ms_per_query": flat_ms})
+
+    for mode in ("ivf_flat", "ivf_pq", "hnsw"):
+        start = time.perf_counter()
+        index, _ = build_faiss_index(data.copy(), mode)
+        build_s = time.perf_counter() - start
+        sweep = [("nprobe", v) for v in NPROBE_SWEEP] if mode != "hnsw" else [("ef_search", v) for v in EF_SEARCH_SWEEP]
+        for name, value in sweep:
+            found, ms = run_queries(index, queries, args.k, **{name: value})
+            rows.append({"mode": mode, "param": f"{name}={value}", "build_s": build_s,
+                         "recall": recall_at_k(found, truth), "ms_per_query": ms})
+
+    print(f"\nRecall@{args.k} vs latency — {args.n:,} vectors x {args.dim} dims, {args.queries} queries")
+    print(f"{'mode':<10}{'param':<16}{'build s':>10}{'recall':>10}{'ms/query':>12}{'speedup':>10}")
+    for r in rows:
+        print(f"{r['mode']:<10}{r['param']:<16}{r['build_s']:>10.2f}{r['recall']:>10.3f}"
+              f"{r['ms_per_query']:>12.3f}{flat_ms / r['ms_per_query']:>9.1f}x")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"n": args.n, "dim": args.dim, "k": args.k, "results": rows}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/chunking_check.py
+"""Check page attribution of overlapping chunks.
+
+Builds a multi-page report whose paragraphs each start with their page tag ("PAGE3
+..."), chunks it the way ingest_pages does (ChunkStore + iter_chunk_spans) and checks
+that every chunk is cited with the page its own text starts on. Paragraphs are
+shorter than a chunk, so chunk i with overlap is chunk i without overlap extended back
+over the previous chunk's tail; the tag that chunk i starts with without overlap is
+the expected page. The citations must also survive a to_dict / from_dict round trip,
+as for stored indexes.
+
+Usage (from the project root):
+    python -m benchmarks.chunking_check
+"""
+import argparse
+import re
+import sys
+from utils.chunk_store import ChunkStore
+from utils.rag_pdf_utils import iter_chunk_spans
+
+SETTINGS = [(1000, 200), (800, 150), (600, 300), (400, 100), (250, 50)]
+_PAGE_TAG = re.compile(r"PAGE(\d+) ")
+
+
+def make_pages(n_pages, paragraphs_per_page=8):
+    return ["\n\n".join(f"PAGE{p} hemoglobin {13 + i / 10:.1f} g/dL, WBC {p * 100 + i} per uL, "
+                        f"reference range noted for test {i}." for i in range(paragraphs_per_page))
+            for p in range(1, n_pages + 1)]
+
+
+def chunk(pages, chunk_size, overlap):
+    store = ChunkStore()
+    doc_id = store.add_document("report.pdf")
+    for start, end, own_start in iter_chunk_spans(store.iter_add_pages(doc_id, pages), chunk_size, overlap):
+        store.add_chunk(doc_id, start, end, own_start)
+    return store
+
+
+def check_setting(pages, chunk_size, overlap):
+    store = chunk(pages, chunk_size, overlap)
+    plain = chunk(pages, chunk_size, 0)
+    restored = ChunkStore.from_dict(store.to_dict())
+    if len(store) != len(plain):
+        return False, f"{len(store)} chunks with overlap vs {len(plain)} without"
+    wrong = []
+    for i in range(len(store)):
+        expected = int(_PAGE_TAG.match(plain.text(i)).group(1))
+        cited = store.meta(i)["page"]
+        if cited != expected or restored.meta(i)["page"] != expected:
+            wrong.append((i, cited, expected))
+    detail = f"{len(store)} chunks, {len(wrong)} cited with the wrong page"
+    if wrong:
+        detail += f" (first: chunk {wrong[0][0]} cited p.{wrong[0][1]}, expected p.{wrong[0][2]})"
+    return not wrong, detail
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=12)
+    args = parser.parse_args()
+
+    pages = make_pages(args.pages)
+    failed = 0
+    for chunk_size, overlap in SETTINGS:
+        ok, detail = check_setting(pages, chunk_size, overlap)
+        failed += not ok
+        print(f"{'PASS' if ok else 'FAIL'}  chunk {chunk_size:>4} overlap {overlap:>3}  {detail}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# benchmarks/db_query_bench.py
+"""Chat query latency with and without the secondary indexes, at 1M chat rows.
+
+Builds a throwaway database at schema version 1 (no indexes), fills it with
+synthetic users/threads/messages, times load_chats_for_session and
+get_chat_sessions, then applies the remaining migrations and times them again.
+
+Usage (from the project root):
+    python -m benchmarks.db_query_bench --rows 1000000 --sessions 20000 --users 2000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from utils import db
+
+
+def fill(n_rows, n_sessions, n_users, seed=0):
+    rng = random.Random(seed)
+    with db.transaction() as cursor:
+        cursor.executemany(
+            "INSERT INTO chat_sessions (id, username, session_name, created_at) VALUES (?, ?, ?, datetime('now', ?))",
+            ((sid, f"user{sid % n_users}", f"Chat_{sid}", f"-{rng.randint(0, 10_000_000)} seconds")
+             for sid in range(1, n_sessions + 1)))
+        cursor.executemany(
+            "INSERT INTO chats (session_id, username, message, role, timestamp) VALUES (?, ?, ?, ?, datetime('now', ?))",
+            ((sid, f"user{sid % n_users}", "lorem ipsum " * rng.randint(1, 20), rng.choice(("user", "assistant")),
+              f"-{rng.randint(0, 10_000_000)} seconds")
+             for sid in (rng.randint(1, n_sessions) for _ in range(n_rows))))
+
+
+def time_queries(n_sessions, n_users, calls, seed=1):
+    rng = random.Random(seed)
+    results = {}
+    for name, fn, arg in (("load_chats_for_session", db.load_chats_for_session, lambda: rng.randint(1, n_sessions)),
+                          ("get_chat_sessions", db.get_chat_sessions, lambda: f"user{rng.randrange(n_users)}")):
+        fn(arg())  # warm the page cache
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn(arg())
+        results[name] = (time.perf_counter() - start) / calls * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_FILE = os.path.join(tmp, "bench.db")
+        db.migrate(target_version=1)
+
+        start = time.perf_counter()
+        fill(args.rows, args.sessions, args.users)
+        print(f"Inserted {args.rows:,} chat rows in {args.sessions:,} threads in {time.perf_counter() - start:.1f}s")
+
+        before = time_queries(args.sessions, args.users, args.calls)
+        start = time.perf_counter()
+        version = db.migrate()
+        print(f"Migrated to schema v{version} in {time.perf_counter() - start:.1f}s")
+        db.close_all_connections()  # drop statements prepared against the old schema
+        after = time_queries(args.sessions, args.users, args.calls)
+        db.close_all_connections()
+
+    print(f"\n{'query':<26}{'v1 ms':>10}{f'v{version} ms':>10}{'speedup':>10}")
+    for name in before:
+        print(f"{name:<26}{before[name]:>10.3f}{after[name]:>10.3f}{before[name] / after[name]:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
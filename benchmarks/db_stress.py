@@ -0,0 +1,113 @@
+# benchmarks/db_stress.py
+"""Concurrent reader/writer stress test for utils/db.py.
+
+Runs writer threads (create_chat_session + save_chat) and reader threads
+(load_chats_for_session, get_chat_sessions, get_user) against a throwaway database
+and fails if any operation hits "database is locked" (or any other error).
+
+Usage (from the project root):
+    python -m benchmarks.db_stress --writers 8 --readers 16 --seconds 10
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from utils import db
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--db", help="database file (default: a temporary file)")
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.db:
+        db.DB_FILE = args.db
+    else:
+        tmpdir = tempfile.TemporaryDirectory()
+        db.DB_FILE = os.path.join(tmpdir.name, "stress.db")
+    db.init_db()
+    db.add_user("stress_user", "pw", "q", "a")
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    counts = {"writes": 0, "reads": 0}
+    errors = []
+    session_ids = [db.create_chat_session("stress_user", "seed")]
+
+    def record(kind, n=1):
+        with lock:
+            counts[kind] += n
+
+    def fail(exc):
+        with lock:
+            errors.append(exc)
+
+    def writer(worker_id):
+        rng = random.Random(worker_id)
+        while not stop.is_set():
+            try:
+                if rng.random() < 0.05:
+                    sid = db.create_chat_session("stress_user", f"w{worker_id}_{time.time()}")
+                    with lock:
+                        session_ids.append(sid)
+                else:
+                    sid = rng.choice(session_ids)
+                    db.save_chat(sid, "stress_user", "x" * rng.randint(10, 400), rng.choice(["user", "assistant"]))
+                record("writes")
+            except Exception as exc:
+                fail(exc)
+
+    def reader(worker_id):
+        rng = random.Random(1000 + worker_id)
+        while not stop.is_set():
+            try:
+                op = rng.random()
+                if op < 0.6:
+                    db.load_chats_for_session(rng.choice(session_ids))
+                elif op < 0.9:
+                    db.get_chat_sessions("stress_user")
+                else:
+                    db.get_user("stress_user")
+                record("reads")
+            except Exception as exc:
+                fail(exc)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    writer = db._writers.get(db.DB_FILE)
+    batches = writer.batches if writer is not None else 0
+    db.close_writers()  # drain queued save_chat rows before timing stops
+    elapsed = time.perf_counter() - start
+    db.close_all_connections()
+
+    locked = [e for e in errors if isinstance(e, sqlite3.OperationalError) and "locked" in str(e)]
+    print(f"{args.writers} writers / {args.readers} readers for {elapsed:.1f}s")
+    print(f"writes: {counts['writes']:>8}  ({counts['writes'] / elapsed:,.0f}/s)")
+    print(f"reads:  {counts['reads']:>8}  ({counts['reads'] / elapsed:,.0f}/s)")
+    if db.WRITE_BEHIND:
+        print(f"write-behind commits: {batches} (avg {counts['writes'] / max(batches, 1):.1f} rows per commit)")
+    print(f"'database is locked' errors: {len(locked)}, other errors: {len(errors) - len(locked)}")
+    for exc in errors[:5]:
+        print(f"  {type(exc).__name__}: {exc}")
+    if tmpdir is not None:
+        tmpdir.cleanup()
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
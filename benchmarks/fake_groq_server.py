@@ -0,0 +1,174 @@
+# benchmarks/fake_groq_server.py
+"""Local stand-in for the Groq chat-completions API.
+
+Serves POST /openai/v1/chat/completions (streaming SSE and plain JSON) with a
+configurable time to first token, token rate and injected 429/503 errors, so the
+LLM gateway, the app and the load tests can run without a network or an API key.
+GET /stats returns request counts and the peak number of concurrent requests.
+
+Usage (from the project root):
+    python -m benchmarks.fake_groq_server --port 8765 --ttft 0.3 --tokens-per-sec 200
+    GROQ_BASE_URL=http://127.0.0.1:8765 streamlit run app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COMPLETIONS_PATH = "/openai/v1/chat/completions"
+
+
+class FakeGroqServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, ttft=0.2, tokens_per_sec=200.0, reply_tokens=60,
+                 error_rate=0.0, error_status=429, seed=0):
+        super().__init__(address, FakeGroqHandler)
+        self.ttft = ttft
+        self.tokens_per_sec = tokens_per_sec
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "errors": 0, "streams": 0, "active": 0, "max_active": 0}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.counts)
+
+    def reset_stats(self):
+        with self.lock:
+            self.counts.update(requests=0, errors=0, streams=0, max_active=0)
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    server: FakeGroqServer
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.server.stats())
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path != COMPLETIONS_PATH:
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        request = json.loads(body or b"{}")
+        server = self.server
+        with server.lock:
+            server.counts["requests"] += 1
+            fail = server.rng.random() < server.error_rate
+            if fail:
+                server.counts["errors"] += 1
+            else:
+                server.counts["active"] += 1
+                server.counts["max_active"] = max(server.counts["max_active"], server.counts["active"])
+        if fail:
+            self._send_json(server.error_status, {"error": {"message": "injected failure", "type": "fake",
+                                                          "code": "rate_limit_exceeded"}},
+                            headers={"retry-after": "0.05"})
+            return
+        try:
+            self._complete(request)
+        finally:
+            with server.lock:
+                server.counts["active"] -= 1
+
+    def _complete(self, request):
+        server = self.server
+        messages = request.get("messages") or [{"content": ""}]
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4 + 1
+        limit = request.get("max_completion_tokens") or request.get("max_tokens") or server.reply_tokens
+        question = str(messages[-1].get("content", ""))[-60:].replace("\n", " ")
+        words = f"This is a **Diagnostic** instrument (fake reply to: {question}).".split()
+        words += ["lorem"] * max(server.reply_tokens - len(words), 0)
+        words = words[:max(min(limit, server.reply_tokens), 1)]
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                 "total_tokens": prompt_tokens + len(words)}
+        base = {"id": f"chatcmpl-fake-{time.time_ns()}", "created": int(time.time()),
+                "model": request.get("model", "fake"), "system_fingerprint": "fake"}
+
+        time.sleep(server.ttft)
+        if not request.get("stream"):
+            time.sleep(len(words) / server.tokens_per_sec)
+            self._send_json(200, {**base, "object": "chat.completion", "usage": usage, "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": " ".join(words)},
+                 "finish_reason": "stop", "logprobs": None}]})
+            return
+
+        with server.lock:
+            server.counts["streams"] += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, word in enumerate(words):
+            delta = {"role": "assistant", "content": word} if i == 0 else {"content": " " + word}
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": None, "logprobs": None}]}
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            time.sleep(1 / server.tokens_per_sec)
+        last = {**base, "object": "chat.completion.chunk", "x_groq": {"id": base["id"], "usage": usage},
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop", "logprobs": None}]}
+        self._write_chunk(f"data: {json.dumps(last)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        self._write_chunk(b"")
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, **options) -> FakeGroqServer:
+    """Start a server on a background thread (port 0 = any free port)"""
+    server = FakeGroqServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name="fake-groq", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=429)
+    args = parser.parse_args()
+
+    server = FakeGroqServer((args.host, args.port), ttft=args.ttft, tokens_per_sec=args.tokens_per_sec,
+                            reply_tokens=args.reply_tokens, error_rate=args.error_rate,
+                            error_status=args.error_status)
+    print(f"Fake Groq API on {server.url} (set GROQ_BASE_URL={server.url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
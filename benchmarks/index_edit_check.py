@@ -0,0 +1,68 @@
+# benchmarks/index_edit_check.py
+"""Check incremental edits of the merged FAISS index in every index mode.
+
+For each of flat / ivf_flat / ivf_pq / hnsw: merge three synthetic "documents" into
+one index (merge_indexes), append a fourth (add_to_index), remove the second
+(remove_from_index), then search for every surviving chunk by its own vector. Each
+must come back as its own id, and no removed id may be returned.
+
+Usage (from the project root):
+    python -m benchmarks.index_edit_check
+"""
+import argparse
+import sys
+import faiss
+import numpy as np
+from utils.rag_pdf_utils import build_faiss_index, merge_indexes, add_to_index, remove_from_index, search_index
+
+MODES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+
+def make_documents(n_docs, chunks_per_doc, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    docs = []
+    for _ in range(n_docs):
+        vectors = rng.standard_normal((chunks_per_doc, dim)).astype('float32')
+        index, _ = build_faiss_index(vectors.copy(), "flat")
+        docs.append((vectors, index))
+    return docs
+
+
+def check_mode(mode, docs):
+    sizes = [len(vectors) for vectors, _ in docs]
+    index = merge_indexes([idx for _, idx in docs[:-1]], mode)
+    add_to_index(index, docs[-1][0].copy(), sum(sizes[:-1]))
+    removed = np.arange(sizes[0], sizes[0] + sizes[1])
+    index = remove_from_index(index, removed, mode)
+    survivors = [i for i in range(sum(sizes)) if not sizes[0] <= i < sizes[0] + sizes[1]]
+    vectors = np.vstack([vectors for vectors, _ in docs])
+
+    wrong = stale = 0
+    for chunk_id in survivors:
+        _, ids = search_index(index, vectors[chunk_id:chunk_id + 1].copy(), top_k=5, nprobe=64, ef_search=128)
+        wrong += ids[0] != chunk_id
+        stale += bool(np.isin(ids, removed).any())
+    base = type(faiss.downcast_index(index)).__name__
+    ok = not wrong and not stale and index.ntotal == len(survivors)
+    return ok, f"{base}: {index.ntotal} vectors, {wrong}/{len(survivors)} survivors not found first, " \
+               f"{stale} results with removed ids"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=3400,
+                        help="chunks per document (3 merged documents must reach PQ_MIN_TRAIN for ivf_pq)")
+    parser.add_argument("--dim", type=int, default=64)
+    args = parser.parse_args()
+
+    docs = make_documents(4, args.chunks, args.dim)
+    failed = 0
+    for mode in MODES:
+        ok, detail = check_mode(mode, docs)
+        failed += not ok
+        print(f"{'PASS' if ok else 'FAIL'}  {mode:<9} {detail}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# benchmarks/llm_gateway_check.py
+"""Exercise utils/llm_gateway.py against the local fake Groq server.
+
+Checks, each against a fresh server and gateway:
+  * coalescing   - N identical concurrent requests (plain and streamed) reach the server once
+  * concurrency  - the per-model cap bounds concurrent upstream requests
+  * retries      - injected 429s / 503s are retried until every request succeeds
+  * rate limit   - the request token bucket paces a burst to the configured RPM
+
+Usage (from the project root):
+    python -m benchmarks.llm_gateway_check
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.fake_groq_server import start_server
+from utils.llm_gateway import BURST_SECONDS, LLMGateway
+
+MODEL = "llama-3.1-8b-instant"
+
+
+def ask(gateway, question, stream=False):
+    request = {"model": MODEL, "messages": [{"role": "user", "content": question}]}
+    if not stream:
+        return gateway.chat.completions.create(**request).choices[0].message.content
+    return "".join(c.choices[0].delta.content or "" for c in gateway.chat.completions.create(stream=True, **request)
+                   if c.choices)
+
+
+def run_concurrently(n, fn):
+    with ThreadPoolExecutor(n) as pool:
+        return list(pool.map(fn, range(n)))
+
+
+def check_coalescing(n):
+    server = start_server(ttft=0.3)
+    gateway = LLMGateway("fake-key", base_url=server.url)
+    plain = run_concurrently(n, lambda i: ask(gateway, "what is a scalpel"))
+    streamed = run_concurrently(n, lambda i: ask(gateway, "what is a stethoscope", stream=True))
+    upstream = server.stats()["requests"]
+    server.shutdown()
+    ok = upstream == 2 and len(set(plain)) == 1 and len(set(streamed)) == 1 and all(streamed)
+    return ok, f"{2 * n} identical requests -> {upstream} upstream calls, gateway {gateway.stats()}"
+
+
+def check_concurrency(n, cap):
+    server = start_server(ttft=0.2)
+    gateway = LLMGateway("fake-key", base_url=server.url, model_concurrency=cap)
+    run_concurrently(n, lambda i: ask(gateway, f"question {i}", stream=i % 2 == 0))
+    peak = server.stats()["max_active"]
+    server.shutdown()
+    return peak <= cap, f"cap {cap}: peak {peak} concurrent upstream requests for {n} distinct calls"
+
+
+def check_retries(n, error_rate):
+    results = []
+    for status in (429, 503):
+        server = start_server(ttft=0.0, error_rate=error_rate, error_status=status, seed=status)
+        gateway = LLMGateway("fake-key", base_url=server.url, max_retries=8)
+        answers = run_concurrently(n, lambda i: ask(gateway, f"question {i}", stream=i % 2 == 0))
+        stats = server.stats()
+        server.shutdown()
+        results.append((all(answers), f"{status}: {stats['errors']} injected errors, "
+                                      f"{gateway.stats().get('retries', 0)} retries, {n} answered"))
+    return all(ok for ok, _ in results), "; ".join(msg for _, msg in results)
+
+
+def check_rate_limit(n, rpm):
+    server = start_server(ttft=0.0)
+    gateway = LLMGateway("fake-key", base_url=server.url, rpm=rpm)
+    start = time.perf_counter()
+    run_concurrently(n, lambda i: ask(gateway, f"question {i}"))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    burst = rpm / 60 * BURST_SECONDS  # allowance available up front
+    expected = max(n - burst, 0) / (rpm / 60)
+    return elapsed >= expected * 0.9, f"{n} requests at {rpm:.0f} rpm took {elapsed:.1f}s (>= {expected:.1f}s expected)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=16)
+    args = parser.parse_args()
+
+    checks = [
+        ("coalescing", lambda: check_coalescing(args.requests)),
+        ("concurrency", lambda: check_concurrency(args.requests, cap=3)),
+        ("retries", lambda: check_retries(args.requests, error_rate=0.4)),
+        ("rate limit", lambda: check_rate_limit(args.requests * 2, rpm=120)),
+    ]
+    failed = 0
+    for name, check in checks:
+        ok, detail = check()
+        failed += not ok
+        print(f"{'PASS' if ok else 'FAIL'}  {name:<12} {detail}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
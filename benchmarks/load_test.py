@@ -0,0 +1,236 @@
+# benchmarks/load_test.py
+"""Multi-user load test of the chatbot and RAG ask flows against the fake Groq server.
+
+Each virtual user is a thread that repeatedly runs one of two flows, the same calls
+the Streamlit pages make:
+
+  chat  create_chat_session (first turn) -> load_chats_for_session (unsummarized tail) ->
+        save_chat(user) -> build_context -> streamed completion -> save_chat(assistant) ->
+        render the newest page of the thread (utils/chat_cache.py)
+  rag   retrieve_top_k over a shared synthetic index -> streamed completion ->
+        save_rag_history -> get_rag_history(one page)
+
+LLM calls go through the shared LLM gateway to a local fake chat-completions server
+with configurable time to first token and token rate, and the database is a
+throwaway SQLite file. The run reports end-to-end latency and time to first token
+per flow (p50/p95/p99), flows per second, and SQLite write-lock waits (the time
+BEGIN IMMEDIATE spends waiting, from utils/metrics.py). The semantic answer cache is
+not exercised.
+
+Usage (from the project root):
+    python -m benchmarks.load_test --users 50 --seconds 60
+    python -m benchmarks.load_test --users 50 --rag-fraction 0.5 --ttft 0.5 --tokens-per-sec 80 --json load.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import utils.metrics as metrics
+import utils.rag_pdf_utils as rag_pdf_utils
+from utils import db
+from utils.chat_cache import get_chat_cache
+from utils.chat_context import build_context
+from utils.chatbot_utils import SYSTEM_MESSAGE, CHAT_MODEL
+from utils.llm_gateway import LLMGateway
+from utils.llm_utils import CompletionStream
+from utils.rag_pdf_utils import build_faiss_index, embed_texts, simple_text_split, retrieve_top_k
+from utils.rag_utils import HISTORY_PAGE_SIZE
+from benchmarks.fake_groq_server import start_server
+from benchmarks.rag_bench import TESTS, FakeEmbeddingModel, report_pages
+
+RAG_MODEL = "llama-3.1-8b-instant"
+RAG_SYSTEM_PROMPT = "You are a Medical Report Analysis Assistant using RAG."
+CHAT_QUESTIONS = ["What does a high {} mean?", "Can you explain that in simpler terms?",
+                  "Which lifestyle changes help with {}?", "Is that dangerous?", "What is a normal {} range?"]
+
+
+def percentiles(values) -> dict:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    arr = np.asarray(values)
+    return {"p50": float(np.percentile(arr, 50)), "p95": float(np.percentile(arr, 95)),
+            "p99": float(np.percentile(arr, 99)), "max": float(arr.max())}
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {"chat": [], "rag": []}
+        self.ttft = {"chat": [], "rag": []}
+        self.errors = []
+
+    def add(self, flow, seconds, ttft):
+        with self.lock:
+            self.latency[flow].append(seconds)
+            if ttft is not None:
+                self.ttft[flow].append(ttft)
+
+    def fail(self, flow, exc):
+        with self.lock:
+            self.errors.append((flow, exc))
+
+
+def build_rag_corpus(n_chunks: int):
+    """Synthetic report chunks and a flat index over them (fake embeddings)"""
+    chunks = []
+    seed = 0
+    while len(chunks) < n_chunks:
+        chunks += simple_text_split("\n\n".join(report_pages(50, seed)), 800, 150)
+        seed += 1
+    chunks = chunks[:n_chunks]
+    vectors = np.vstack([embed_texts(chunks[i:i + 256], use_cache=False) for i in range(0, len(chunks), 256)])
+    index, _ = build_faiss_index(vectors, "flat")
+    return chunks, index
+
+
+def chat_flow(gateway, username, state, rng, rec):
+    start = time.perf_counter()
+    if state.get("session_id") is None:
+        state["session_id"] = db.create_chat_session(username, f"load {time.time():.0f}")
+    session_id = state["session_id"]
+    question = rng.choice(CHAT_QUESTIONS).format(rng.choice(TESTS)[0])
+    summary = db.get_chat_summary(session_id)
+    tail = db.load_chats_for_session(session_id, after_id=summary[1] if summary else 0)
+    db.save_chat(session_id, username, question, "user")
+    turns = [{"id": r["id"], "role": r["role"], "content": r["message"]} for r in tail]
+    turns.append({"id": None, "role": "user", "content": question})
+    messages = build_context(gateway, session_id, SYSTEM_MESSAGE, turns)
+    stream = CompletionStream(gateway, model=CHAT_MODEL, messages=messages, temperature=0.7,
+                              max_completion_tokens=1024)
+    for _ in stream:
+        pass
+    db.save_chat(session_id, username, stream.text, "assistant")
+    get_chat_cache().messages(session_id)  # the page reruns and renders the thread
+    rec.add("chat", time.perf_counter() - start, stream.ttft)
+
+
+def rag_flow(gateway, username, corpus, rng, rec):
+    chunks, index = corpus
+    start = time.perf_counter()
+    name, unit, low, high = rng.choice(TESTS)
+    query = f"What is the {name} value on page {rng.randint(1, 50)}?"
+    results = retrieve_top_k(query, chunks, index, top_k=5)
+    context = "\n\n".join(r["chunk"] for r in results)
+    messages = [{"role": "system", "content": RAG_SYSTEM_PROMPT},
+                {"role": "user", "content": f"Context:\n{context}\n\nQuestion:\n{query}"}]
+    stream = CompletionStream(gateway, model=RAG_MODEL, messages=messages)
+    for _ in stream:
+        pass
+    db.save_rag_history(username, query, stream.text)
+    db.get_rag_history(username, limit=HISTORY_PAGE_SIZE + 1)
+    rec.add("rag", time.perf_counter() - start, stream.ttft)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50, help="concurrent virtual users")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--rag-fraction", type=float, default=0.3, help="share of flows that are RAG asks")
+    parser.add_argument("--think", type=float, default=0.0, help="mean pause between a user's flows (s)")
+    parser.add_argument("--ttft", type=float, default=0.3, help="fake server time to first token (s)")
+    parser.add_argument("--tokens-per-sec", type=float, default=150.0)
+    parser.add_argument("--reply-tokens", type=int, default=80)
+    parser.add_argument("--model-concurrency", type=int, default=None, help="gateway cap per model")
+    parser.add_argument("--rag-chunks", type=int, default=2000, help="size of the shared RAG index")
+    parser.add_argument("--db", help="database file (default: a temporary file)")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.db:
+        db.DB_FILE = args.db
+    else:
+        tmpdir = tempfile.TemporaryDirectory()
+        db.DB_FILE = os.path.join(tmpdir.name, "load.db")
+    db.init_db()
+    metrics.METRICS_ENABLED = True  # span()/observe() check this on every call
+    rag_pdf_utils._embedding_model = FakeEmbeddingModel()
+    corpus = build_rag_corpus(args.rag_chunks)
+
+    server = start_server(ttft=args.ttft, tokens_per_sec=args.tokens_per_sec, reply_tokens=args.reply_tokens)
+    options = {} if args.model_concurrency is None else {"model_concurrency": args.model_concurrency}
+    gateway = LLMGateway("fake-key", base_url=server.url, **options)
+    rec = Recorder()
+    stop = threading.Event()
+    metrics.get_metrics().reset()
+
+    def user(user_no):
+        rng = random.Random(user_no)
+        username = f"clinician{user_no:03d}"
+        state = {}
+        while not stop.is_set():
+            flow = "rag" if rng.random() < args.rag_fraction else "chat"
+            try:
+                if flow == "rag":
+                    rag_flow(gateway, username, corpus, rng, rec)
+                else:
+                    chat_flow(gateway, username, state, rng, rec)
+            except Exception as exc:
+                rec.fail(flow, exc)
+            if args.think:
+                stop.wait(rng.expovariate(1 / args.think))
+
+    threads = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(args.users)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    writer = db._writers.get(db.DB_FILE)
+    batches = writer.batches if writer is not None else 0
+    db.close_writers()
+    elapsed = time.perf_counter() - start
+    db.close_all_connections()
+
+    snapshot = metrics.get_metrics().snapshot()
+    report = {"users": args.users, "seconds": elapsed, "rag_fraction": args.rag_fraction,
+              "fake_server": {"ttft": args.ttft, "tokens_per_sec": args.tokens_per_sec,
+                              "reply_tokens": args.reply_tokens, **server.stats()},
+              "gateway": gateway.stats(), "flows": {}, "db": {}, "write_behind_commits": batches,
+              "errors": len(rec.errors)}
+    server.shutdown()
+
+    print(f"{args.users} users for {elapsed:.1f}s (fake LLM: ttft {args.ttft}s, {args.tokens_per_sec:.0f} tok/s; "
+          f"gateway cap {gateway.model_concurrency} per model)")
+    print(f"{'flow':<6}{'count':>8}{'per s':>9}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'ttft p50':>10}{'ttft p99':>10}")
+    for flow in ("chat", "rag"):
+        lat = percentiles(rec.latency[flow])
+        ttft = percentiles(rec.ttft[flow])
+        count = len(rec.latency[flow])
+        report["flows"][flow] = {"count": count, "per_second": count / elapsed, "latency": lat, "ttft": ttft}
+        print(f"{flow:<6}{count:>8}{count / elapsed:>9.2f}{lat['p50']:>9.3f}{lat['p95']:>9.3f}{lat['p99']:>9.3f}"
+              f"{ttft['p50']:>10.3f}{ttft['p99']:>10.3f}")
+
+    print(f"\n{'sqlite':<14}{'count':>8}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'total s':>9}")
+    for stage in ("db_lock_wait", "db_write", "db_read"):
+        s = snapshot["stages"].get(stage)
+        if s is None:
+            continue
+        report["db"][stage] = s
+        print(f"{stage:<14}{s['count']:>8}{s['p50'] * 1000:>9.2f}{s['p99'] * 1000:>9.2f}{s['max'] * 1000:>9.2f}"
+              f"{s['total']:>9.2f}")
+    if db.WRITE_BEHIND:
+        print(f"write-behind commits: {batches}")
+    print(f"fake server: {report['fake_server']['requests']} requests, peak {report['fake_server']['max_active']} "
+          f"concurrent; gateway: {report['gateway']}")
+    print(f"errors: {len(rec.errors)}")
+    for flow, exc in rec.errors[:5]:
+        print(f"  {flow}: {type(exc).__name__}: {exc}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=4)
+    if tmpdir is not None:
+        tmpdir.cleanup()
+    sys.exit(1 if rec.errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+# benchmarks/rag_bench.py
+"""Offline throughput / peak-memory benchmark of the RAG pipeline stages.
+
+For each corpus size (in chunks) a synthetic multi-page lab-report PDF is generated
+(seeded, so every run sees the same bytes) and these stages are timed:
+
+  load_pdf_bytes     pages/s     PDF bytes -> text
+  simple_text_split  chunks/s    text -> chunks
+  embed_texts        chunks/s    chunks -> vectors, in ingestion-sized batches (cold cache)
+  build_faiss_index  vectors/s   vectors -> index (--index-mode, "auto" like the app)
+  retrieve_top_k     queries/s   question -> top-k chunks (also p50/p99 ms per query)
+
+A deterministic fake model (vectors seeded from a hash of the text) stands in for
+all-MiniLM, so the run needs no network or GPU and measures the pipeline around the
+model. Peak RSS is the process high-water mark during each stage (reset between
+stages where /proc/self/clear_refs allows it). Each stage runs --repeat times and
+the run with the median time is reported, so one noisy run does not decide the
+result; a run of a sub-millisecond stage (e.g. indexing 10 vectors) loops it for
+MIN_RUN_SECONDS and reports the time per call. Results are written as JSON; given
+--baseline, any stage whose throughput drops or whose peak RSS grows by more than
+--threshold against that file is reported and the exit status is 1. Stages faster
+than MIN_COMPARE_SECONDS per call and memory growth under MIN_COMPARE_MB are not
+compared. Back-to-back runs on a shared one-core machine differ by up to ~40%, hence
+the default threshold of 50%; on a quiet machine pass a tighter one.
+
+Usage (from the project root):
+    python -m benchmarks.rag_bench --json rag_bench.json
+    python -m benchmarks.rag_bench --sizes 10,1000 --repeat 9 --baseline rag_bench.json --threshold 0.15
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import numpy as np
+import utils.embedding_cache as embedding_cache
+import utils.rag_pdf_utils as rag_pdf_utils
+from utils.query_cache import get_query_cache
+from utils.rag_pdf_utils import (
+    EMBED_BATCH_SIZE, load_pdf_bytes, simple_text_split, embed_texts, build_faiss_index, retrieve_top_k
+)
+
+DEFAULT_SIZES = "10,1000,100000"
+EMBEDDING_DIM = 384  # all-MiniLM-L6-v2
+PAGE_LINES = 40
+MIN_RUN_SECONDS = 0.2  # a run of a fast stage calls it repeatedly for at least this long
+# Below these, differences are timer/allocator noise and are reported but not flagged
+MIN_COMPARE_SECONDS = 0.002  # per call
+MIN_COMPARE_MB = 5.0  # absolute peak-RSS growth
+
+TESTS = [("Hemoglobin", "g/dL", 11.0, 17.5), ("WBC count", "x10^3/uL", 3.5, 12.0),
+         ("Platelets", "x10^3/uL", 140, 420), ("Fasting glucose", "mg/dL", 65, 160),
+         ("HbA1c", "%", 4.5, 9.5), ("Creatinine", "mg/dL", 0.5, 1.6), ("ALT", "U/L", 7, 70),
+         ("Total cholesterol", "mg/dL", 130, 280), ("LDL", "mg/dL", 60, 190), ("TSH", "mIU/L", 0.3, 6.0),
+         ("Sodium", "mmol/L", 130, 148), ("Potassium", "mmol/L", 3.2, 5.4), ("Vitamin D", "ng/mL", 10, 80)]
+NOTES = ["Sample collected after overnight fast.", "Mild elevation, repeat test advised in 3 months.",
+         "Within reference range.", "Hemolysed sample, value may be overestimated.",
+         "Patient on metformin 500 mg twice daily.", "Compared with previous report, trend is stable."]
+
+
+# ================================
+#  Synthetic input
+# ================================
+def _pdf_text(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages) -> bytes:
+    """Minimal PDF with one Helvetica text stream per page (lines separated by \\n)"""
+    n = len(pages)
+    font_id = 3 + 2 * n
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               f"<< /Type /Pages /Kids [{' '.join(f'{3 + 2 * i} 0 R' for i in range(n))}] /Count {n} >>".encode()]
+    for i, text in enumerate(pages):
+        ops = ["BT", "/F1 9 Tf", "11 TL", "40 800 Td"] + [f"({_pdf_text(line)}) Tj T*" for line in text.split("\n")]
+        stream = "\n".join(ops + ["ET"]).encode("latin-1", "replace")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Resources << /Font << /F1 {font_id} 0 R "
+                       f">> >> /Contents {4 + 2 * i} 0 R >>".encode())
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(out))
+        out += f"{i + 1} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{off:010d} 00000 n \n".encode() for off in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def report_pages(n_pages: int, seed: int = 0):
+    """Lab-report-like page texts: a header, result lines and the odd clinical note"""
+    rng = np.random.default_rng(seed)
+    pages = []
+    for p in range(n_pages):
+        lines = [f"Patient ID MR-{seed:04d}-{p // 4:05d}   Report page {p + 1}   Lab: Central Diagnostics", ""]
+        while len(lines) < PAGE_LINES:
+            name, unit, low, high = TESTS[rng.integers(len(TESTS))]
+            lines.append(f"{name}: {rng.uniform(low, high):.1f} {unit} (ref {low}-{high})")
+            if rng.random() < 0.15:
+                lines += [NOTES[rng.integers(len(NOTES))], ""]
+        pages.append("\n".join(lines))
+    return pages
+
+
+def pages_for_chunks(n_chunks: int, chunk_size: int, overlap: int, seed: int = 0) -> int:
+    sample = report_pages(50, seed)
+    chunks_per_page = len(simple_text_split(load_pdf_bytes(make_pdf(sample)), chunk_size, overlap)) / len(sample)
+    return max(1, round(n_chunks / chunks_per_page))
+
+
+class FakeEmbeddingModel:
+    """Stands in for SentenceTransformer.encode: unit vectors seeded from each text's hash"""
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def encode(self, texts, **kwargs):
+        out = np.empty((len(texts), self.dim), dtype="float32")
+        for i, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+            out[i] = np.random.default_rng(seed).standard_normal(self.dim, dtype="float32")
+        out /= np.linalg.norm(out, axis=1, keepdims=True)
+        return out
+
+
+# ================================
+#  Measurement
+# ================================
+def _reset_peak_rss() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _rss_mb(field: str = "VmRSS") -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss: kB on Linux, bytes on macOS; it never resets, so it is only an upper bound
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2 ** 20 if sys.platform == "darwin" else 1024)
+
+
+def measure(fn, items: int, unit: str, repeat: int):
+    """Median-time run of `repeat` runs of fn(); returns (result of the last run, stats)"""
+    runs = []
+    result = None
+    for _ in range(repeat):
+        result = None  # drop the previous run's output before measuring memory again
+        before = _rss_mb()
+        _reset_peak_rss()
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            result = fn()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= MIN_RUN_SECONDS:
+                break
+        seconds = elapsed / calls
+        peak = _rss_mb("VmHWM")
+        run = {"seconds": seconds, "items": items, "unit": unit, "throughput": items / seconds if seconds else 0.0,
+               "peak_rss_mb": peak, "rss_delta_mb": max(peak - before, 0.0)}
+        runs.append(run)
+    runs.sort(key=lambda r: r["seconds"])
+    return result, runs[len(runs) // 2]
+
+
+def bench_size(target_chunks, args, queries):
+    pages = report_pages(pages_for_chunks(target_chunks, args.chunk_size, args.overlap, args.seed),
+                         seed=args.seed)
+    pdf = make_pdf(pages)
+    stages = {}
+
+    text, stages["load_pdf_bytes"] = measure(lambda: load_pdf_bytes(pdf), len(pages), "pages/s", args.repeat)
+    chunks, stages["simple_text_split"] = measure(lambda: simple_text_split(text, args.chunk_size, args.overlap),
+                                                  0, "chunks/s", args.repeat)
+    n = len(chunks)
+    stages["simple_text_split"].update(items=n, throughput=n / stages["simple_text_split"]["seconds"])
+
+    def embed():
+        # A fresh cache per run, so every run measures cold-cache ingestion
+        with tempfile.TemporaryDirectory(prefix="rag_bench_cache_") as cache_dir:
+            embedding_cache._cache = embedding_cache.EmbeddingCache(cache_dir, max_entries=max(n, 1))
+            try:
+                vectors = np.vstack([embed_texts(chunks[i:i + EMBED_BATCH_SIZE])
+                                     for i in range(0, n, EMBED_BATCH_SIZE)])
+                embedding_cache.flush_embedding_cache()  # count persisting the cache too
+                return vectors
+            finally:
+                embedding_cache._cache = None
+
+    vectors, stages["embed_texts"] = measure(embed, n, "chunks/s", args.repeat)
+    (index, _), stages["build_faiss_index"] = measure(lambda: build_faiss_index(vectors.copy(), args.index_mode),
+                                                      n, "vectors/s", args.repeat)
+
+    latencies = []
+
+    def retrieve():
+        latencies.clear()
+        get_query_cache().clear()  # every run encodes its questions
+        for q in queries:
+            start = time.perf_counter()
+            retrieve_top_k(q, chunks, index, top_k=args.top_k)
+            latencies.append(time.perf_counter() - start)
+
+    _, stages["retrieve_top_k"] = measure(retrieve, len(queries), "queries/s", args.repeat)
+    ms = np.array(latencies) * 1000
+    stages["retrieve_top_k"].update(p50_ms=float(np.percentile(ms, 50)), p99_ms=float(np.percentile(ms, 99)))
+    return {"chunks": n, "pages": len(pages), "pdf_mb": len(pdf) / 2 ** 20,
+            "index_type": type(index).__name__, "stages": stages}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Regressions of `results` against `baseline` as printable lines"""
+    problems = []
+    for size, run in results["sizes"].items():
+        base_run = baseline.get("sizes", {}).get(size)
+        if base_run is None:
+            continue
+        for stage, now in run["stages"].items():
+            base = base_run["stages"].get(stage)
+            if base is None:
+                continue
+            timed_enough = min(base["seconds"], now["seconds"]) >= MIN_COMPARE_SECONDS
+            if timed_enough and base["throughput"] and now["throughput"] < base["throughput"] * (1 - threshold):
+                problems.append(f"{size:>7} chunks  {stage:<18} throughput {now['throughput']:,.0f} {now['unit']} "
+                                f"vs baseline {base['throughput']:,.0f} ({now['throughput'] / base['throughput'] - 1:+.0%})")
+            grown = now["rss_delta_mb"] - base["rss_delta_mb"]
+            if grown > MIN_COMPARE_MB and now["rss_delta_mb"] > base["rss_delta_mb"] * (1 + threshold):
+                problems.append(f"{size:>7} chunks  {stage:<18} memory {now['rss_delta_mb']:,.1f} MB "
+                                f"vs baseline {base['rss_delta_mb']:,.1f} MB "
+                                f"({now['rss_delta_mb'] / base['rss_delta_mb'] - 1:+.0%})")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated corpus sizes in chunks")
+    parser.add_argument("--chunk-size", type=int, default=800)
+    parser.add_argument("--overlap", type=int, default=150)
+    parser.add_argument("--index-mode", default="auto")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per stage; the median is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.5, help="allowed relative regression (0.5 = 50%%)")
+    args = parser.parse_args()
+
+    rag_pdf_utils._embedding_model = FakeEmbeddingModel()
+    rng = np.random.default_rng(args.seed + 1)
+    queries = [f"What is the {TESTS[rng.integers(len(TESTS))][0]} value on page {rng.integers(1, 50)}?"
+               for _ in range(args.queries)]
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    results = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                 "cpu_count": os.cpu_count(), "peak_rss_resettable": _reset_peak_rss(),
+                 "chunk_size": args.chunk_size, "overlap": args.overlap, "index_mode": args.index_mode,
+                 "queries": args.queries, "top_k": args.top_k, "repeat": args.repeat, "seed": args.seed,
+                 "embedding": f"fake, {EMBEDDING_DIM} dims"},
+        "sizes": {},
+    }
+    print(f"{'chunks':>8}  {'stage':<18}{'seconds':>10}{'throughput':>16}  {'unit':<10}{'peak MB':>9}{'+MB':>8}")
+    for size in sizes:
+        run = results["sizes"][str(size)] = bench_size(size, args, queries)
+        for stage, s in run["stages"].items():
+            print(f"{run['chunks']:>8,}  {stage:<18}{s['seconds']:>10.3f}{s['throughput']:>16,.1f}  {s['unit']:<10}"
+                  f"{s['peak_rss_mb']:>9.0f}{s['rss_delta_mb']:>8.1f}")
+        r = run["stages"]["retrieve_top_k"]
+        print(f"{'':>8}  retrieve p50 {r['p50_ms']:.2f} ms, p99 {r['p99_ms']:.2f} ms ({run['index_type']}, "
+              f"{run['pages']} pages, {run['pdf_mb']:.1f} MB PDF)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"\nResults written to {args.json}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(results, json.load(f), args.threshold)
+        if problems:
+            print(f"\n❌ {len(problems)} regression(s) beyond {args.threshold:.0%} against {args.baseline}:")
+            print("\n".join(problems))
+            sys.exit(1)
+        print(f"\n✅ No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# benchmarks/startup_report.py
+"""Per-module import cost, measured in a fresh interpreter for each module.
+
+Uses `python -X importtime` so every number is a cold import (nothing shared
+between rows). The login page only needs the first group; everything in the
+second group should now load only when the RAG / chatbot pages are opened.
+
+Usage (from the project root):
+    python -m benchmarks.startup_report
+    python -m benchmarks.startup_report --modules numpy faiss
+"""
+import argparse
+import re
+import subprocess
+import sys
+
+LOGIN_PAGE_MODULES = ["streamlit", "jwt", "werkzeug.security", "utils.db", "utils.warmup"]
+ML_MODULES = ["numpy", "faiss", "PyPDF2", "groq", "torch", "sentence_transformers",
+              "utils.rag_pdf_utils", "utils.rag_utils", "utils.chatbot_utils"]
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_cost(module):
+    """Return (cumulative seconds, [(self seconds, name), ...]) for a cold import of `module`"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None, []
+    total, parts = 0.0, []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if not m:
+            continue
+        self_us, cumulative_us, _, name = m.groups()
+        parts.append((int(self_us) / 1e6, name))
+        if name == module:
+            total = int(cumulative_us) / 1e6
+    return total, sorted(parts, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="*", help="modules to measure (default: app startup set)")
+    parser.add_argument("--top", type=int, default=3, help="show the N most expensive sub-imports per module")
+    args = parser.parse_args()
+
+    groups = [("custom", args.modules)] if args.modules else [("login page", LOGIN_PAGE_MODULES),
+                                                              ("ML stack (lazy)", ML_MODULES)]
+    for title, modules in groups:
+        print(f"\n== {title} ==")
+        print(f"{'module':<28}{'cold import s':>14}   heaviest sub-imports (self time)")
+        group_total = 0.0
+        for module in modules:
+            total, parts = import_cost(module)
+            if total is None:
+                print(f"{module:<28}{'not installed':>14}")
+                continue
+            group_total += total
+            top = ", ".join(f"{name} {sec:.3f}s" for sec, name in parts[:args.top])
+            print(f"{module:<28}{total:>14.3f}   {top}")
+        print(f"{'(sum, overlaps counted twice)':<28}{group_total:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# migrate_rag_history.py
+"""One-shot import of data/rag_history.json into the SQLite `rag_history` table.
+
+Entries are inserted per user in their original order. On success the JSON file is
+renamed to rag_history.json.migrated, so running the script again is a no-op.
+
+Usage (from the project root):
+    python migrate_rag_history.py
+    python migrate_rag_history.py --json path/to/rag_history.json --dry-run
+"""
+import argparse
+import json
+import os
+import sys
+from utils.db import init_db, import_rag_history
+
+HISTORY_FILE = "data/rag_history.json"
+
+
+def read_history(path):
+    """Yield (username, query, answer) from the old {username: [{query, answer}, ...]} file"""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    decoder = json.JSONDecoder()
+    pos = 0
+    # Concurrent read-modify-write cycles sometimes left several objects back to back
+    while True:
+        while pos < len(text) and text[pos].isspace():
+            pos += 1
+        if pos >= len(text):
+            break
+        data, pos = decoder.raw_decode(text, pos)
+        for username, entries in data.items():
+            for entry in entries:
+                yield username, entry["query"], entry["answer"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--json", default=HISTORY_FILE)
+    parser.add_argument("--dry-run", action="store_true", help="count entries without writing")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.json):
+        print(f"Nothing to migrate: {args.json} not found.")
+        return
+    try:
+        rows = list(read_history(args.json))
+    except (ValueError, KeyError, AttributeError) as e:
+        print(f"❌ Could not parse {args.json}: {e}")
+        sys.exit(1)
+
+    users = len({r[0] for r in rows})
+    if args.dry_run:
+        print(f"{len(rows)} entries for {users} users would be imported.")
+        return
+    init_db()
+    count = import_rag_history(rows)
+    os.replace(args.json, args.json + ".migrated")
+    print(f"✅ Imported {count} entries for {users} users; renamed {args.json} -> {args.json}.migrated")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# utils/bm25_index.py
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Iterable, List, Tuple
+import numpy as np
+
+# ================================
+#  Compact BM25 inverted index
+# ================================
+# Postings are compiled into CSR-style NumPy arrays: for term t, its documents are
+# post_docs[offsets[t]:offsets[t+1]] and post_weights holds the precomputed BM25
+# contribution of the term in each of those documents. A query is then just a few
+# array gathers and adds, with no embedding model involved. Removed documents are
+# masked out of results; their postings (and their share of df/avgdl) stay.
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Keeps lab codes and identifiers such as "hba1c", "b12", "covid-19", "5.4" or "mg/dl" whole
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._vocab = {}
+        self._term_docs: List[array] = []
+        self._term_tfs: List[array] = []
+        self._doc_len = array("I")
+        self._deleted = np.zeros(0, dtype=np.int64)
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._post_docs = np.zeros(0, dtype=np.int32)
+        self._post_weights = np.zeros(0, dtype=np.float32)
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str], **kwargs) -> "BM25Index":
+        index = cls(**kwargs)
+        index.add(texts)
+        return index
+
+    def add(self, texts: Iterable[str]):
+        """Append documents; ids continue from the current document count"""
+        for text in texts:
+            doc_id = len(self._doc_len)
+            tokens = tokenize(text)
+            self._doc_len.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                tid = self._vocab.get(term)
+                if tid is None:
+                    tid = self._vocab[term] = len(self._term_docs)
+                    self._term_docs.append(array("I"))
+                    self._term_tfs.append(array("H"))
+                self._term_docs[tid].append(doc_id)
+                self._term_tfs[tid].append(min(tf, 65535))
+            self._dirty = True
+
+    def remove(self, ids: Iterable[int]):
+        """Mask documents out of every future search"""
+        self._deleted = np.union1d(self._deleted, np.fromiter(ids, dtype=np.int64))
+
+    def copy(self) -> "BM25Index":
+        """Independent copy that can be extended or masked without touching this one"""
+        other = BM25Index(self.k1, self.b)
+        with self._lock:
+            other._vocab = dict(self._vocab)
+            other._term_docs = [array("I", d) for d in self._term_docs]
+            other._term_tfs = [array("H", t) for t in self._term_tfs]
+            other._doc_len = array("I", self._doc_len)
+            other._deleted = self._deleted.copy()
+            # Compiled arrays are replaced, never modified, so they can be shared
+            other._offsets, other._post_docs, other._post_weights = self._offsets, self._post_docs, self._post_weights
+            other._dirty = self._dirty
+        return other
+
+    def _compile(self):
+        n_docs = len(self._doc_len)
+        doc_len = np.frombuffer(self._doc_len, dtype=np.uint32).astype(np.float32)
+        avgdl = float(doc_len.mean()) if n_docs else 1.0
+        norm = self.k1 * (1 - self.b + self.b * doc_len / max(avgdl, 1e-9))
+
+        sizes = np.fromiter((len(d) for d in self._term_docs), dtype=np.int64, count=len(self._term_docs))
+        self._offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=self._offsets[1:])
+        self._post_docs = np.frombuffer(b"".join(d.tobytes() for d in self._term_docs), dtype=np.uint32).astype(np.int32)
+        tfs = np.frombuffer(b"".join(t.tobytes() for t in self._term_tfs), dtype=np.uint16).astype(np.float32)
+
+        df = sizes.astype(np.float32)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        term_idf = np.repeat(idf, sizes)
+        self._post_weights = (term_idf * tfs * (self.k1 + 1) / (tfs + norm[self._post_docs])).astype(np.float32)
+        self._dirty = False
+
+    def search(self, query: str, top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (scores, ids) of the best `top_k` documents, best first"""
+        if self._dirty:
+            with self._lock:
+                if self._dirty:
+                    self._compile()
+        scores = np.zeros(len(self._doc_len), dtype=np.float32)
+        for term, qtf in Counter(tokenize(query)).items():
+            tid = self._vocab.get(term)
+            if tid is None:
+                continue
+            lo, hi = self._offsets[tid], self._offsets[tid + 1]
+            # A document appears once per term, so fancy-index += is safe here
+            scores[self._post_docs[lo:hi]] += qtf * self._post_weights[lo:hi]
+        if self._deleted.size:
+            scores[self._deleted] = 0
+        candidates = np.flatnonzero(scores)
+        if candidates.size == 0:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+        if candidates.size > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return scores[order], order.astype(np.int64)
+
+    def nbytes(self) -> int:
+        postings = sum(d.itemsize * len(d) + t.itemsize * len(t) for d, t in zip(self._term_docs, self._term_tfs))
+        compiled = self._offsets.nbytes + self._post_docs.nbytes + self._post_weights.nbytes
+        return postings + compiled + self._doc_len.itemsize * len(self._doc_len)
+
+    def __len__(self):
+        return len(self._doc_len)
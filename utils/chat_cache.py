@@ -0,0 +1,81 @@
+# utils/chat_cache.py
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+from utils.db import chat_version, chat_sessions_version, get_chat_sessions, load_chats_for_session
+
+# ================================
+#  Chat thread / thread-list cache (process-wide, shared by all sessions)
+# ================================
+# Every click reruns the chatbot page. A thread is cached as its newest messages plus
+# the version utils/db.py bumps on save_chat / delete_chat_session; while the version
+# matches, a rerun runs no SQL. "Load older" fetches one more page below the oldest
+# cached id (keyset), so the cost of a rerun depends on the window shown, not on the
+# length of the thread.
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", 50))
+CHAT_CACHE_THREADS = 512
+
+
+class ChatCache:
+    def __init__(self, max_threads: int = CHAT_CACHE_THREADS):
+        self.max_threads = max_threads
+        self._lock = threading.Lock()
+        self._threads = OrderedDict()  # session_id -> (version, rows oldest first, has_more)
+        self._sessions = OrderedDict()  # username -> (version, rows)
+
+    def _put(self, entries: OrderedDict, key, value):
+        with self._lock:
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > self.max_threads:
+                entries.popitem(last=False)
+
+    def _get(self, entries: OrderedDict, key):
+        with self._lock:
+            value = entries.get(key)
+            if value is not None:
+                entries.move_to_end(key)
+            return value
+
+    def messages(self, session_id: int, limit: int = CHAT_PAGE_SIZE) -> Tuple[List[dict], bool]:
+        """(newest `limit` messages of a thread, oldest first; whether older ones exist)"""
+        version = chat_version(session_id)  # read first: a write racing the query only makes the entry stale
+        entry = self._get(self._threads, session_id)
+        if entry is not None and entry[0] == version:
+            _, rows, has_more = entry
+            if len(rows) >= limit or not has_more:
+                return rows[-limit:], has_more or len(rows) > limit
+            # Load older: fetch just the missing page below the oldest cached message
+            want = limit - len(rows)
+            older = load_chats_for_session(session_id, limit=want + 1, before_id=rows[0]["id"])
+            has_more = len(older) > want
+            rows = [dict(r) for r in older[-want:]] + rows
+        else:
+            fetched = load_chats_for_session(session_id, limit=limit + 1)
+            has_more = len(fetched) > limit
+            rows = [dict(r) for r in fetched[-limit:]]
+        self._put(self._threads, session_id, (version, rows, has_more))
+        return rows, has_more
+
+    def sessions(self, username: str) -> List[dict]:
+        version = chat_sessions_version(username)
+        entry = self._get(self._sessions, username)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        rows = [dict(r) for r in get_chat_sessions(username)]
+        self._put(self._sessions, username, (version, rows))
+        return rows
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_chat_cache() -> ChatCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ChatCache()
+    return _cache
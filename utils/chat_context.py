@@ -0,0 +1,105 @@
+# utils/chat_context.py
+import os
+from typing import List
+from utils.db import get_chat_summary, save_chat_summary
+from utils.metrics import timed, incr
+
+# ================================
+#  Token-budgeted chat context
+# ================================
+# The prompt is: system message + rolling summary of older turns + the most recent
+# turns that fit CONTEXT_TOKEN_BUDGET. When the unsummarized tail outgrows its share
+# of the budget, the oldest turns are folded into the summary until the tail is back
+# under RECENT_FRACTION of it, so the summarizer runs once every few turns rather
+# than on every message. The summary is stored per thread in `chat_summaries`.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKENS", 3000))
+RECENT_FRACTION = 0.5
+SUMMARY_MODEL = os.getenv("CHAT_SUMMARY_MODEL", "llama-3.1-8b-instant")
+SUMMARY_MAX_TOKENS = 300
+MAX_FOLD_TOKENS = 4 * CONTEXT_TOKEN_BUDGET  # cap on one summarizer call's input
+MESSAGE_OVERHEAD_TOKENS = 4
+CHARS_PER_TOKEN = 4
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and a medical chatbot. "
+    "Update the summary with the new messages. Keep the instruments, symptoms, categories and "
+    "user preferences (e.g. requested output format) that later questions may refer to. "
+    f"Reply with the updated summary only, in at most {SUMMARY_MAX_TOKENS * 3 // 4} words."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for Llama-style BPE vocabularies)"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def message_tokens(message: dict) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _fit_recent(turns: List[dict], budget: int) -> int:
+    """Smallest i such that turns[i:] fits in `budget` tokens (the last turn is always kept)"""
+    used = 0
+    for i in range(len(turns) - 1, -1, -1):
+        used += message_tokens(turns[i])
+        if used > budget and i < len(turns) - 1:
+            return i + 1
+    return 0
+
+
+def _clip(message: dict, budget: int) -> dict:
+    max_chars = max(budget - MESSAGE_OVERHEAD_TOKENS, 1) * CHARS_PER_TOKEN
+    if len(message["content"]) <= max_chars:
+        return message
+    return {**message, "content": message["content"][-max_chars:]}
+
+
+@timed("summarize_turns")
+def summarize_turns(client, summary: str, turns: List[dict]) -> str:
+    """Fold `turns` into `summary` with one call to the (small) summary model"""
+    start = _fit_recent(turns, MAX_FOLD_TOKENS)  # very old overflow of a legacy thread is dropped
+    transcript = "\n".join(f"{t['role']}: {t['content']}" for t in turns[start:])
+    response = client.chat.completions.create(
+        model=SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"},
+        ],
+        temperature=0.2,
+        max_completion_tokens=SUMMARY_MAX_TOKENS,
+    )
+    return response.choices[0].message.content.strip()
+
+
+def build_context(client, session_id: int, system_message: dict, turns: List[dict],
+                  budget: int = CONTEXT_TOKEN_BUDGET) -> List[dict]:
+    """Chat-completion messages for a thread, bounded by `budget` tokens plus the system prompt.
+
+    `turns` are {"id", "role", "content"} dicts, oldest first; the newest one may not be
+    persisted yet (id None).
+    """
+    stored = get_chat_summary(session_id)
+    summary, covered = stored if stored else ("", 0)
+    tail = [t for t in turns if t["id"] is None or t["id"] > covered]
+
+    window = budget - SUMMARY_MAX_TOKENS - MESSAGE_OVERHEAD_TOKENS
+    start = _fit_recent(tail, window)
+    if start:
+        keep = _fit_recent(tail, int(window * RECENT_FRACTION))
+        fold = tail[:keep]
+        try:
+            summary = summarize_turns(client, summary, fold)
+            save_chat_summary(session_id, summary, max(t["id"] for t in fold))
+            start = keep
+        except Exception:
+            # Summarizer unavailable: plain truncation still keeps the prompt in budget
+            incr("chat_summary_failures")
+    tail = tail[start:]
+    if tail:
+        tail[-1] = _clip(tail[-1], window)
+
+    messages = [system_message]
+    if summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    messages += [{"role": t["role"], "content": t["content"]} for t in tail]
+    return messages
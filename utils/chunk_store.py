@@ -0,0 +1,169 @@
+# utils/chunk_store.py
+from array import array
+from bisect import bisect_right
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+# ================================
+#  Offset-based chunk store
+# ================================
+# Page text is kept once per document. A chunk is just (doc_id, page, start, end) in
+# four array-backed columns, where start/end are offsets into the document text
+# ("\n\n".join(pages)). Chunk text is only sliced out when someone asks for it.
+# Chunk ids are positions and never change: removing a document tombstones it (its
+# chunks stay in the columns, its page text is dropped) and new documents append.
+PAGE_SEPARATOR = "\n\n"
+
+
+class ChunkStore:
+    def __init__(self):
+        self.doc_names: List[str] = []
+        self.doc_keys: List[Optional[str]] = []  # content_key of each document, if known
+        self.removed_docs: Set[int] = set()
+        self._doc_chunks = array("I")
+        self._pages: List[List[str]] = []
+        self._page_starts: List[array] = []
+        self._doc_len: List[int] = []
+        self.doc_ids = array("I")
+        self.pages = array("I")
+        self.starts = array("Q")
+        self.ends = array("Q")
+
+    # ---------- building ----------
+    def add_document(self, name: str, key: Optional[str] = None) -> int:
+        self.doc_names.append(name)
+        self.doc_keys.append(key)
+        self._doc_chunks.append(0)
+        self._pages.append([])
+        self._page_starts.append(array("Q"))
+        self._doc_len.append(0)
+        return len(self.doc_names) - 1
+
+    def add_page(self, doc_id: int, text: str) -> Tuple[int, str]:
+        """Append a page; returns (offset of the page in the document, normalized text)"""
+        text = text.replace("\r", "\n")
+        pages = self._pages[doc_id]
+        start = self._doc_len[doc_id] + (len(PAGE_SEPARATOR) if pages else 0)
+        pages.append(text)
+        self._page_starts[doc_id].append(start)
+        self._doc_len[doc_id] = start + len(text)
+        return start, text
+
+    def iter_add_pages(self, doc_id: int, pages: Iterable[str]) -> Iterator[Tuple[int, str]]:
+        for text in pages:
+            yield self.add_page(doc_id, text)
+
+    def add_chunk(self, doc_id: int, start: int, end: int, own_start: Optional[int] = None) -> int:
+        """Record a chunk. Its page is the one holding `own_start`, where the chunk's own
+        text begins after any overlap carried back from the previous chunk (default: start)"""
+        starts = self._page_starts[doc_id]
+        self.doc_ids.append(doc_id)
+        self.pages.append(max(bisect_right(starts, start if own_start is None else own_start) - 1, 0))
+        self.starts.append(start)
+        self.ends.append(end)
+        self._doc_chunks[doc_id] += 1
+        return len(self.starts) - 1
+
+    def extend(self, other: "ChunkStore") -> int:
+        """Append another store's documents and chunks; returns the id of its first chunk"""
+        first = len(self.starts)
+        offset = len(self.doc_names)
+        self.doc_names.extend(other.doc_names)
+        self.doc_keys.extend(other.doc_keys)
+        self.removed_docs.update(d + offset for d in other.removed_docs)
+        self._doc_chunks.extend(other._doc_chunks)
+        self._pages.extend(other._pages)
+        self._page_starts.extend(other._page_starts)
+        self._doc_len.extend(other._doc_len)
+        self.doc_ids.extend(d + offset for d in other.doc_ids)
+        self.pages.extend(other.pages)
+        self.starts.extend(other.starts)
+        self.ends.extend(other.ends)
+        return first
+
+    def remove_document(self, doc_id: int) -> List[int]:
+        """Tombstone a document; returns the ids of its chunks"""
+        if doc_id in self.removed_docs:
+            return []
+        self.removed_docs.add(doc_id)
+        self._pages[doc_id] = []
+        return [i for i, d in enumerate(self.doc_ids) if d == doc_id]
+
+    def copy(self) -> "ChunkStore":
+        """Independent columns and document lists; page strings are shared, not copied"""
+        return ChunkStore.merge([self])
+
+    # ---------- reading ----------
+    def slice(self, doc_id: int, start: int, end: int) -> str:
+        starts = self._page_starts[doc_id]
+        p0 = max(bisect_right(starts, start) - 1, 0)
+        p1 = max(bisect_right(starts, max(end - 1, start)) - 1, p0)
+        text = PAGE_SEPARATOR.join(self._pages[doc_id][p0:p1 + 1])
+        base = starts[p0]
+        return text[start - base:end - base].strip()
+
+    def text(self, i: int) -> str:
+        return self.slice(self.doc_ids[i], self.starts[i], self.ends[i])
+
+    def is_live(self, i: int) -> bool:
+        return self.doc_ids[i] not in self.removed_docs
+
+    def documents(self) -> List[Tuple[int, str, int]]:
+        """(doc_id, name, chunk count) of every document that has not been removed"""
+        return [(d, name, self._doc_chunks[d]) for d, name in enumerate(self.doc_names)
+                if d not in self.removed_docs]
+
+    def live_keys(self) -> List[Optional[str]]:
+        return [self.doc_keys[d] for d, _, _ in self.documents()]
+
+    def meta(self, i: int) -> dict:
+        doc_id = self.doc_ids[i]
+        return {"doc_id": doc_id, "doc": self.doc_names[doc_id], "page": self.pages[i] + 1}
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i: int) -> str:
+        return self.text(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.text(i)
+
+    def nbytes(self) -> int:
+        text_bytes = sum(len(p) for pages in self._pages for p in pages)
+        columns = sum(col.itemsize * len(col) for col in (self.doc_ids, self.pages, self.starts, self.ends))
+        return text_bytes + columns
+
+    # ---------- combining / persistence ----------
+    @classmethod
+    def merge(cls, stores: List["ChunkStore"]) -> "ChunkStore":
+        """Concatenate stores (chunk order preserved); page strings are shared, not copied"""
+        merged = cls()
+        for store in stores:
+            merged.extend(store)
+        return merged
+
+    def to_dict(self) -> dict:
+        return {
+            "docs": [{"name": n, "key": k, "pages": p, "removed": d in self.removed_docs}
+                     for d, (n, k, p) in enumerate(zip(self.doc_names, self.doc_keys, self._pages))],
+            "doc_ids": self.doc_ids.tolist(),
+            "pages": self.pages.tolist(),
+            "starts": self.starts.tolist(),
+            "ends": self.ends.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ChunkStore":
+        store = cls()
+        for doc in data["docs"]:
+            doc_id = store.add_document(doc["name"], doc.get("key"))
+            for page in doc["pages"]:
+                store.add_page(doc_id, page)
+            if doc.get("removed"):
+                store.removed_docs.add(doc_id)
+        for doc_id, start, end in zip(data["doc_ids"], data["starts"], data["ends"]):
+            store.add_chunk(doc_id, start, end)
+        if "pages" in data:
+            store.pages = array("I", data["pages"])
+        return store
@@ -1,20 +1,322 @@
 # utils/db.py
 import sqlite3
 import os
+import queue
+import atexit
+import threading
+from contextlib import contextmanager
 from werkzeug.security import generate_password_hash, check_password_hash
+from utils.db_writer import WriteBehindWriter
+from utils.metrics import span, incr
 
 DB_FILE = "data/smartai.db"
 
-def get_connection():
-    os.makedirs("data", exist_ok=True)
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+# Connection pool settings. Streamlit runs each session (and each rerun) on its own
+# thread, so connections are borrowed from a small per-database pool instead of being
+# opened per query.
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+
+DOCUMENT_INDEX_COLUMNS = [
+    ("content_hash", "TEXT"),
+    ("chunk_size", "INTEGER"),
+    ("overlap", "INTEGER"),
+    ("model_name", "TEXT"),
+    ("num_chunks", "INTEGER"),
+    ("index_path", "TEXT"),
+]
+
+# Added by migration 6: ingestion job state
+INGEST_JOB_COLUMNS = [
+    ("status", "TEXT NOT NULL DEFAULT 'ready'"),
+    ("upload_path", "TEXT"),
+    ("pages_done", "INTEGER NOT NULL DEFAULT 0"),
+    ("total_pages", "INTEGER"),
+    ("error", "TEXT"),
+    ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+    ("worker_pid", "INTEGER"),
+    ("started_at", "DATETIME"),
+    ("heartbeat_at", "DATETIME"),
+    ("finished_at", "DATETIME"),
+]
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _open_connection(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # isolation_level=None: autocommit for single statements; transaction() issues BEGIN IMMEDIATE
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=BUSY_TIMEOUT_MS / 1000,
+                           isolation_level=None, cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA foreign_keys=ON")
     return conn
 
+def _get_pool(path):
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, queue.LifoQueue(maxsize=POOL_SIZE))
+    return pool
+
+def get_connection():
+    """A new, configured connection owned by the caller (who must close it).
+
+    Application code should prefer connection() / transaction(), which reuse pooled connections.
+    """
+    return _open_connection(DB_FILE)
+
+@contextmanager
+def _borrow(path=None):
+    path = path or DB_FILE
+    pool = _get_pool(path)
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = _open_connection(path)
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+@contextmanager
+def connection(path=None):
+    """Borrow a pooled connection for reads (autocommit)"""
+    with span("db_read"), _borrow(path) as conn:
+        yield conn
+
+@contextmanager
+def transaction(path=None):
+    """Borrow a pooled connection and run the block in one write transaction.
+
+    BEGIN IMMEDIATE takes the write lock up front, so concurrent writers wait on
+    busy_timeout instead of failing with "database is locked" when upgrading a read.
+    Commits on success, rolls back on any exception.
+    """
+    with span("db_write"), _borrow(path) as conn:
+        with span("db_lock_wait"):
+            conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn.cursor()
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+# ---------------------------
+# WRITE-BEHIND (GROUP COMMIT) FOR CHAT / HISTORY INSERTS
+# ---------------------------
+# save_chat / save_rag_history only enqueue; a background writer per database commits
+# queued rows in batches. Readers call _flush_writes(key) first, which waits only for
+# the rows queued for that chat thread / user, so a session always sees its own writes.
+# Set SMARTAI_WRITE_BEHIND=0 to write synchronously.
+WRITE_BEHIND = os.getenv("SMARTAI_WRITE_BEHIND", "1") != "0"
+WRITE_FLUSH_SECONDS = 60  # longest a reader waits for queued writes before raising
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+def _execute_batch(path, items, final=False):
+    """Commit queued writes in order; returns how many from the front are done.
+
+    An IntegrityError row (e.g. its thread was deleted meanwhile) is dropped. On other
+    errors ("database is locked", disk full) the rows from the failing one on are left
+    for the writer to retry; once it runs out of retries it passes final=True, and
+    every row that still fails is dropped. Dropped rows count as db_writes_dropped.
+    """
+    if not final:
+        try:
+            with transaction(path) as cursor:
+                for sql, params in items:
+                    cursor.execute(sql, params)
+            return len(items)
+        except sqlite3.IntegrityError:
+            pass  # one bad row must not sink the whole batch: go row by row
+        except sqlite3.Error:
+            return 0
+    for done, (sql, params) in enumerate(items):
+        try:
+            with transaction(path) as cursor:
+                cursor.execute(sql, params)
+        except sqlite3.IntegrityError:
+            incr("db_writes_dropped")
+        except sqlite3.Error:
+            if not final:
+                return done
+            incr("db_writes_dropped")
+    return len(items)
+
+def _get_writer(path):
+    writer = _writers.get(path)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(path)
+            if writer is None:
+                writer = _writers[path] = WriteBehindWriter(lambda items, final: _execute_batch(path, items, final))
+    return writer
+
+def _write(sql, params, key=None):
+    if not WRITE_BEHIND:
+        with transaction() as cursor:
+            cursor.execute(sql, params)
+        return
+    _get_writer(DB_FILE).submit(sql, params, key)
+
+def _flush_writes(key=None):
+    writer = _writers.get(DB_FILE)
+    if writer is not None and not writer.flush(key, timeout=WRITE_FLUSH_SECONDS):
+        raise sqlite3.OperationalError(f"queued writes not committed after {WRITE_FLUSH_SECONDS:g}s")
+
+def close_writers():
+    """Drain and stop every write-behind writer (registered with atexit)"""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+atexit.register(close_writers)
+
+def close_all_connections():
+    """Close every pooled connection (e.g. on shutdown or in benchmarks)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+# ---------------------------
+# SCHEMA MIGRATIONS
+# ---------------------------
+# The schema version lives in PRAGMA user_version. Each migration runs exactly once per
+# database, in order, inside one transaction; init_db() is a no-op after the first call
+# in a process, so Streamlit reruns no longer touch the schema.
+_initialized = set()
+_init_lock = threading.Lock()
+
 def init_db():
-    conn = get_connection()
-    cursor = conn.cursor()
+    """Bring the schema up to date (once per process per database file)"""
+    if DB_FILE in _initialized:
+        return
+    with _init_lock:
+        if DB_FILE not in _initialized:
+            migrate()
+            _initialized.add(DB_FILE)
+
+def migrate(target_version=None):
+    """Apply pending migrations up to target_version (default: latest); returns the new version"""
+    target = len(MIGRATIONS) if target_version is None else target_version
+    conn = _open_connection(DB_FILE)
+    try:
+        # Table rebuilds must not trigger FK actions; this pragma is a no-op inside a transaction
+        conn.execute("PRAGMA foreign_keys=OFF")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for number in range(version + 1, target + 1):
+                MIGRATIONS[number - 1](conn.cursor())
+                conn.execute(f"PRAGMA user_version={number}")
+                version = number
+            if conn.execute("PRAGMA foreign_key_check").fetchone() is not None:
+                raise sqlite3.IntegrityError("foreign key violations after migration")
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        return version
+    finally:
+        conn.close()
+
+def _migration_1_base_tables(cursor):
+    _create_tables(cursor)
+
+def _migration_2_indexes(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chats_session_ts ON chats(session_id, timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_created ON chat_sessions(username, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_rag_history_user_ts ON rag_history(username, timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_user_uploaded ON documents(username, uploaded_at)")
+
+def _migration_3_chat_session_fk(cursor):
+    # SQLite cannot add a foreign key in place, so rebuild `chats`. Messages whose thread
+    # no longer exists were unreachable from the UI and are dropped.
+    cursor.execute("""
+    CREATE TABLE chats_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id INTEGER NOT NULL REFERENCES chat_sessions(id) ON DELETE CASCADE,
+        username TEXT NOT NULL,
+        message TEXT NOT NULL,
+        role TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""")
+    cursor.execute("""
+    INSERT INTO chats_new (id, session_id, username, message, role, timestamp)
+    SELECT id, session_id, username, message, role, timestamp FROM chats
+    WHERE session_id IN (SELECT id FROM chat_sessions)""")
+    cursor.execute("DROP TABLE chats")
+    cursor.execute("ALTER TABLE chats_new RENAME TO chats")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chats_session_ts ON chats(session_id, timestamp)")
+
+def _migration_4_chat_summaries(cursor):
+    # Rolling summary of the turns that no longer fit the chatbot's context budget
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS chat_summaries (
+        session_id INTEGER PRIMARY KEY REFERENCES chat_sessions(id) ON DELETE CASCADE,
+        summary TEXT NOT NULL,
+        covered_until_id INTEGER NOT NULL,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""")
+
+def _migration_5_semantic_cache(cursor):
+    # Past chatbot question/answer pairs, looked up by question embedding (utils/semantic_cache.py)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS semantic_cache (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scope TEXT NOT NULL,
+        question TEXT NOT NULL,
+        embedding BLOB NOT NULL,
+        answer TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0
+    )""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_semantic_cache_scope_created ON semantic_cache(scope, created_at)")
+
+def _migration_6_ingest_jobs(cursor):
+    # `documents` doubles as the ingestion job table (utils/ingest_worker.py); rows that
+    # existed before were indexed inline and are already finished
+    for column, definition in INGEST_JOB_COLUMNS:
+        cursor.execute(f"ALTER TABLE documents ADD COLUMN {column} {definition}")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_status ON documents(status, id)")
+
+def _migration_7_chat_keyset_index(cursor):
+    # load_chats_for_session pages by id (keyset), newest first
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chats_session_id ON chats(session_id, id)")
 
+MIGRATIONS = [
+    _migration_1_base_tables,
+    _migration_2_indexes,
+    _migration_3_chat_session_fk,
+    _migration_4_chat_summaries,
+    _migration_5_semantic_cache,
+    _migration_6_ingest_jobs,
+    _migration_7_chat_keyset_index,
+]
+
+def _create_tables(cursor):
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS users (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -39,8 +341,20 @@ def init_db():
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         username TEXT NOT NULL,
         filename TEXT NOT NULL,
-        uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        content_hash TEXT,
+        chunk_size INTEGER,
+        overlap INTEGER,
+        model_name TEXT,
+        num_chunks INTEGER,
+        index_path TEXT
     )""")
+    # Older databases created `documents` without the index-store columns
+    existing = {row["name"] for row in cursor.execute("PRAGMA table_info(documents)")}
+    for column, col_type in DOCUMENT_INDEX_COLUMNS:
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE documents ADD COLUMN {column} {col_type}")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents(content_hash)")
 
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS rag_history (
@@ -61,127 +375,278 @@ def init_db():
     """)
 
 
-    conn.commit()
-    conn.close()
-
 # ---------------------------
 # USER FUNCTIONS
 # ---------------------------
 def add_user(username, password, question, answer):
-    conn = get_connection()
-    cursor = conn.cursor()
     password_hash = generate_password_hash(password)
-    cursor.execute("INSERT INTO users (username, password_hash, secret_question, secret_answer) VALUES (?, ?, ?, ?)",
-                   (username, password_hash, question, answer))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute("INSERT INTO users (username, password_hash, secret_question, secret_answer) VALUES (?, ?, ?, ?)",
+                       (username, password_hash, question, answer))
 
 def get_user(username):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
-    return cursor.fetchone()
+    with connection() as conn:
+        return conn.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
 
 def check_password(username, password):
     user = get_user(username)
     return user and check_password_hash(user["password_hash"], password)
 
 def update_password(username, new_password):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET password_hash=? WHERE username=?",
-                   (generate_password_hash(new_password), username))
-    conn.commit()
-    conn.close()
+    password_hash = generate_password_hash(new_password)
+    with transaction() as cursor:
+        cursor.execute("UPDATE users SET password_hash=? WHERE username=?", (password_hash, username))
 
 # ---------------------------
 # CHAT FUNCTIONS
 # ---------------------------
 def save_chat(username, message, role):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO chats (username, message, role) VALUES (?, ?, ?)",
-                   (username, message, role))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute("INSERT INTO chats (username, message, role) VALUES (?, ?, ?)",
+                       (username, message, role))
 
 def load_chats(username):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM chats WHERE username=? ORDER BY timestamp", (username,))
-    return cursor.fetchall()
+    _flush_writes()
+    with connection() as conn:
+        return conn.execute("SELECT * FROM chats WHERE username=? ORDER BY timestamp", (username,)).fetchall()
 
 def clear_chats(username):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM chats WHERE username=?", (username,))
-    conn.commit()
-    conn.close()
+    _flush_writes()
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM chats WHERE username=?", (username,))
 
 # ---------------------------
 # RAG HISTORY FUNCTIONS
 # ---------------------------
 def save_rag_history(username, query, answer):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO rag_history (username, query, answer) VALUES (?, ?, ?)",
-                   (username, query, answer))
-    conn.commit()
-    conn.close()
-
-def get_rag_history(username):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM rag_history WHERE username=? ORDER BY timestamp DESC", (username,))
-    return cursor.fetchall()
+    _write("INSERT INTO rag_history (username, query, answer) VALUES (?, ?, ?)", (username, query, answer),
+           key=("rag_history", username))
+
+def get_rag_history(username, limit=None, offset=0):
+    """A user's Q&A history, newest first; `limit`/`offset` page through it"""
+    _flush_writes(("rag_history", username))
+    sql = "SELECT * FROM rag_history WHERE username=? ORDER BY timestamp DESC, id DESC"
+    params = (username,)
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params += (limit, offset)
+    with connection() as conn:
+        return conn.execute(sql, params).fetchall()
+
+def import_rag_history(rows):
+    """Bulk-insert (username, query, answer) rows, oldest first; returns the count"""
+    rows = list(rows)
+    with transaction() as cursor:
+        cursor.executemany("INSERT INTO rag_history (username, query, answer) VALUES (?, ?, ?)", rows)
+    return len(rows)
 
 def clear_rag_history(username):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM rag_history WHERE username=?", (username,))
-    conn.commit()
-    conn.close()
+    _flush_writes(("rag_history", username))
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM rag_history WHERE username=?", (username,))
+
+# ---------------------------
+# DOCUMENT / INDEX STORE FUNCTIONS
+# ---------------------------
+def add_document(username, filename, content_hash, chunk_size, overlap, model_name, num_chunks, index_path):
+    with transaction() as cursor:
+        cursor.execute("""INSERT INTO documents
+                          (username, filename, content_hash, chunk_size, overlap, model_name, num_chunks, index_path)
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                       (username, filename, content_hash, chunk_size, overlap, model_name, num_chunks, index_path))
+        return cursor.lastrowid
+
+# ---------------------------
+# INGESTION JOB FUNCTIONS (documents.status: queued -> running -> ready | failed)
+# ---------------------------
+# Called from worker processes too, so every write here is synchronous (not write-behind)
+def enqueue_ingest_job(username, filename, content_hash, chunk_size, overlap, model_name, upload_path):
+    with transaction() as cursor:
+        cursor.execute("""INSERT INTO documents
+                          (username, filename, content_hash, chunk_size, overlap, model_name, upload_path, status)
+                          VALUES (?, ?, ?, ?, ?, ?, ?, 'queued')""",
+                       (username, filename, content_hash, chunk_size, overlap, model_name, upload_path))
+        return cursor.lastrowid
+
+def get_active_ingest_job(content_hash):
+    """A queued or running job for the same bytes + settings, if any"""
+    with connection() as conn:
+        return conn.execute("SELECT * FROM documents WHERE content_hash=? AND status IN ('queued', 'running') "
+                            "ORDER BY id LIMIT 1", (content_hash,)).fetchone()
+
+def claim_ingest_job(worker_pid):
+    """Atomically move the oldest queued job to running; returns it or None"""
+    with transaction() as cursor:
+        row = cursor.execute("SELECT * FROM documents WHERE status='queued' ORDER BY id LIMIT 1").fetchone()
+        if row is None:
+            return None
+        cursor.execute("""UPDATE documents SET status='running', worker_pid=?, started_at=CURRENT_TIMESTAMP,
+                          heartbeat_at=CURRENT_TIMESTAMP, attempts=attempts + 1 WHERE id=?""",
+                       (worker_pid, row["id"]))
+        return cursor.execute("SELECT * FROM documents WHERE id=?", (row["id"],)).fetchone()
+
+def update_ingest_progress(job_id, pages_done, total_pages, chunks_done):
+    with transaction() as cursor:
+        cursor.execute("""UPDATE documents SET pages_done=?, total_pages=?, num_chunks=?,
+                          heartbeat_at=CURRENT_TIMESTAMP WHERE id=?""",
+                       (pages_done, total_pages, chunks_done, job_id))
+
+def finish_ingest_job(job_id, num_chunks, index_path):
+    with transaction() as cursor:
+        cursor.execute("""UPDATE documents SET status='ready', num_chunks=?, index_path=?, upload_path=NULL,
+                          pages_done=total_pages, finished_at=CURRENT_TIMESTAMP WHERE id=?""",
+                       (num_chunks, index_path, job_id))
+
+def fail_ingest_job(job_id, error):
+    with transaction() as cursor:
+        cursor.execute("UPDATE documents SET status='failed', error=?, finished_at=CURRENT_TIMESTAMP WHERE id=?",
+                       (error, job_id))
+
+def requeue_stale_ingest_jobs(stale_seconds, max_attempts):
+    """Jobs whose worker stopped heartbeating go back to the queue, or fail after max_attempts.
+
+    Returns the jobs marked failed, so the caller can discard their uploads.
+    """
+    with transaction() as cursor:
+        stale = "status='running' AND heartbeat_at < datetime('now', ?)"
+        cutoff = f"-{int(stale_seconds)} seconds"
+        failed = cursor.execute(f"SELECT * FROM documents WHERE {stale} AND attempts >= ?",
+                                (cutoff, max_attempts)).fetchall()
+        cursor.execute(f"UPDATE documents SET status='failed', error='worker stopped responding', "
+                       f"finished_at=CURRENT_TIMESTAMP WHERE {stale} AND attempts >= ?", (cutoff, max_attempts))
+        cursor.execute(f"UPDATE documents SET status='queued', worker_pid=NULL WHERE {stale}", (cutoff,))
+        return failed
+
+def get_ingest_jobs(job_ids):
+    if not job_ids:
+        return []
+    with connection() as conn:
+        marks = ",".join("?" * len(job_ids))
+        return conn.execute(f"SELECT * FROM documents WHERE id IN ({marks}) ORDER BY id", tuple(job_ids)).fetchall()
+
+def get_document_by_hash(content_hash):
+    with connection() as conn:
+        return conn.execute("SELECT * FROM documents WHERE content_hash=? ORDER BY id DESC LIMIT 1",
+                            (content_hash,)).fetchone()
+
+def get_documents(username):
+    with connection() as conn:
+        return conn.execute("SELECT * FROM documents WHERE username=? ORDER BY uploaded_at DESC",
+                            (username,)).fetchall()
 
 # ========================
 # CHAT SESSION FUNCTIONS
 # ========================
+# ---------------------------
+# CHANGE COUNTERS (for the chatbot page's caches)
+# ---------------------------
+# Bumped by every write to a thread (and to a user's thread list) made through this
+# module, so a cached copy is current while its version still matches. Process-local,
+# like the caches that use them.
+_versions = {}
+_versions_lock = threading.Lock()
+
+def _bump_version(key):
+    with _versions_lock:
+        _versions[key] = _versions.get(key, 0) + 1
+
+def chat_version(session_id):
+    return _versions.get(("chats", session_id), 0)
+
+def chat_sessions_version(username):
+    return _versions.get(("chat_sessions", username), 0)
+
 def create_chat_session(username, session_name):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO chat_sessions (username, session_name) VALUES (?, ?)", (username, session_name))
-    conn.commit()
-    session_id = cursor.lastrowid
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute("INSERT INTO chat_sessions (username, session_name) VALUES (?, ?)", (username, session_name))
+        session_id = cursor.lastrowid
+    _bump_version(("chat_sessions", username))
     return session_id
 
 def get_chat_sessions(username):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM chat_sessions WHERE username=? ORDER BY created_at DESC", (username,))
-    return cursor.fetchall()
+    with connection() as conn:
+        return conn.execute("SELECT * FROM chat_sessions WHERE username=? ORDER BY created_at DESC",
+                            (username,)).fetchall()
 
 def delete_chat_session(session_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM chats WHERE session_id=?", (session_id,))
-    cursor.execute("DELETE FROM chat_sessions WHERE id=?", (session_id,))
-    conn.commit()
-    conn.close()
+    # The thread's messages go with it (chats.session_id ... ON DELETE CASCADE)
+    _flush_writes(("chats", session_id))
+    with transaction() as cursor:
+        row = cursor.execute("SELECT username FROM chat_sessions WHERE id=?", (session_id,)).fetchone()
+        cursor.execute("DELETE FROM chat_sessions WHERE id=?", (session_id,))
+    _bump_version(("chats", session_id))
+    if row is not None:
+        _bump_version(("chat_sessions", row["username"]))
 
 # ========================
 # CHAT MESSAGES FUNCTIONS (UPDATED)
 # ========================
 def save_chat(session_id, username, message, role):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO chats (username, message, role, session_id) VALUES (?, ?, ?, ?)",
-                   (username, message, role, session_id))
-    conn.commit()
-    conn.close()
-
-def load_chats_for_session(session_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM chats WHERE session_id=? ORDER BY timestamp", (session_id,))
-    return cursor.fetchall()
+    _write("INSERT INTO chats (username, message, role, session_id) VALUES (?, ?, ?, ?)",
+           (username, message, role, session_id), key=("chats", session_id))
+    _bump_version(("chats", session_id))
+
+def load_chats_for_session(session_id, limit=None, before_id=None, after_id=None):
+    """Messages of a thread, oldest first.
+
+    limit keeps only the newest `limit` messages; before_id / after_id restrict to ids
+    below / above a known message (keyset paging: "load older" passes the oldest id shown).
+    """
+    _flush_writes(("chats", session_id))
+    query = "SELECT * FROM chats WHERE session_id=?"
+    params = [session_id]
+    if before_id is not None:
+        query += " AND id<?"
+        params.append(before_id)
+    if after_id is not None:
+        query += " AND id>?"
+        params.append(after_id)
+    with connection() as conn:
+        if limit is None:
+            return conn.execute(query + " ORDER BY id", params).fetchall()
+        rows = conn.execute(query + " ORDER BY id DESC LIMIT ?", params + [limit]).fetchall()
+    return rows[::-1]
+
+# ========================
+# CHAT SUMMARY FUNCTIONS
+# ========================
+def get_chat_summary(session_id):
+    """(summary, id of the last message it covers) for a thread, or None"""
+    with connection() as conn:
+        row = conn.execute("SELECT summary, covered_until_id FROM chat_summaries WHERE session_id=?",
+                           (session_id,)).fetchone()
+    return (row["summary"], row["covered_until_id"]) if row else None
+
+def save_chat_summary(session_id, summary, covered_until_id):
+    with transaction() as cursor:
+        cursor.execute("""
+        INSERT INTO chat_summaries (session_id, summary, covered_until_id) VALUES (?, ?, ?)
+        ON CONFLICT(session_id) DO UPDATE SET summary=excluded.summary,
+            covered_until_id=excluded.covered_until_id, updated_at=CURRENT_TIMESTAMP""",
+                       (session_id, summary, covered_until_id))
+
+# ========================
+# SEMANTIC CACHE FUNCTIONS
+# ========================
+def add_semantic_cache_entry(scope, question, embedding, answer, created_at):
+    with transaction() as cursor:
+        cursor.execute("INSERT INTO semantic_cache (scope, question, embedding, answer, created_at) VALUES (?, ?, ?, ?, ?)",
+                       (scope, question, embedding, answer, created_at))
+        return cursor.lastrowid
+
+def get_semantic_cache_entries(scope, created_after):
+    with connection() as conn:
+        return conn.execute("SELECT id, embedding, answer, created_at FROM semantic_cache "
+                            "WHERE scope=? AND created_at>? ORDER BY created_at",
+                            (scope, created_after)).fetchall()
+
+def record_semantic_cache_hit(entry_id):
+    _write("UPDATE semantic_cache SET hits = hits + 1 WHERE id=?", (entry_id,))
+
+def delete_semantic_cache_entries(entry_ids):
+    with transaction() as cursor:
+        cursor.executemany("DELETE FROM semantic_cache WHERE id=?", [(i,) for i in entry_ids])
 
+def purge_semantic_cache(scope, created_before):
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM semantic_cache WHERE scope=? AND created_at<=?", (scope, created_before))
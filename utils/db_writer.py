@@ -0,0 +1,139 @@
+# utils/db_writer.py
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Tuple
+
+# ================================
+#  Group-commit write-behind queue
+# ================================
+# Callers enqueue (sql, params) and return immediately. A background thread commits
+# everything queued so far in one transaction once WRITE_BATCH_ROWS rows are waiting
+# or the oldest has waited WRITE_BATCH_MS. flush() is the read barrier: it blocks until
+# every write enqueued before the call has been committed (or, given a key, every
+# write submitted under that key, e.g. one chat thread). submit() blocks once
+# WRITE_QUEUE_MAX rows are waiting, so a burst cannot outrun the disk indefinitely.
+# execute_batch(batch, final) returns how many rows from the front of the batch are
+# done; the rest go back to the head of the queue and are retried after an exponential
+# backoff, so a transient "database is locked" delays writes without reordering them.
+# After WRITE_RETRIES attempts without progress the batch is written with final=True:
+# row by row, dropping the rows that still fail (disk full, read-only file, bad SQL),
+# so one bad row cannot stall the rows queued behind it.
+WRITE_BATCH_ROWS = 64
+WRITE_BATCH_MS = 20
+WRITE_QUEUE_MAX = 1024
+WRITE_RETRY_MS = 50
+WRITE_RETRY_MAX_MS = 2000
+WRITE_RETRIES = 5
+WRITE_CLOSE_SECONDS = 10.0
+
+log = logging.getLogger(__name__)
+
+Write = Tuple[str, tuple]
+
+
+class WriteBehindWriter:
+    def __init__(self, execute_batch: Callable[[List[Write], bool], int],
+                 max_rows: int = WRITE_BATCH_ROWS, max_delay_ms: int = WRITE_BATCH_MS,
+                 max_queue: int = WRITE_QUEUE_MAX, name: str = "db-writer"):
+        self._execute_batch = execute_batch
+        self.max_rows = max_rows
+        self.max_queue = max_queue
+        self.max_delay = max_delay_ms / 1000
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._enqueued = 0
+        self._committed = 0
+        self._closed = False
+        self._flush_waiters = 0
+        self._last_seq = {}  # key -> sequence number of the newest write under it
+        self.batches = 0
+        self.retries = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, sql: str, params: tuple = (), key=None) -> int:
+        """Queue a write; returns its sequence number"""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._pending) < self.max_queue or self._closed)
+            if self._closed:
+                raise RuntimeError("write-behind writer is closed")
+            self._pending.append((sql, params))
+            self._enqueued += 1
+            if key is not None:
+                self._last_seq[key] = self._enqueued
+            self._cond.notify_all()
+            return self._enqueued
+
+    def flush(self, key=None, timeout: float = None) -> bool:
+        """Wait until everything enqueued so far (under `key`, if given) is committed; False on timeout"""
+        with self._cond:
+            target = self._enqueued if key is None else self._last_seq.get(key, 0)
+            if self._committed >= target:
+                return True
+            self._flush_waiters += 1
+            self._cond.notify_all()  # wake the writer: someone is waiting to read
+            try:
+                return self._cond.wait_for(lambda: self._committed >= target, timeout)
+            finally:
+                self._flush_waiters -= 1
+
+    def pending(self) -> int:
+        with self._cond:
+            return self._enqueued - self._committed
+
+    def close(self, timeout: float = WRITE_CLOSE_SECONDS):
+        """Stop accepting writes, drain the queue and stop the thread (waiting at most `timeout`)"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _next_batch(self) -> List[Write]:
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending or self._closed)
+            if not self._pending:
+                return []
+            # Group commit: give concurrent writers up to max_delay to join this batch,
+            # unless the batch is full, we are shutting down, or a reader is waiting on flush()
+            deadline = time.monotonic() + self.max_delay
+            while len(self._pending) < self.max_rows and not self._closed and not self._flush_waiters:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    break
+            batch = []
+            while self._pending and len(batch) < self.max_rows:
+                batch.append(self._pending.popleft())
+            return batch
+
+    def _run(self):
+        backoff = WRITE_RETRY_MS / 1000
+        attempts = 0
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return  # closed and drained
+            final = attempts >= WRITE_RETRIES
+            try:
+                done = self._execute_batch(batch, final)
+            except Exception:
+                log.exception("write-behind batch of %d rows failed", len(batch))
+                done = len(batch) if final else 0
+            with self._cond:
+                self._committed += done
+                if done:
+                    self.batches += 1
+                if done < len(batch):
+                    self._pending.extendleft(reversed(batch[done:]))
+                    self.retries += 1
+                if len(self._last_seq) > 4 * self.max_queue:
+                    self._last_seq = {k: v for k, v in self._last_seq.items() if v > self._committed}
+                self._cond.notify_all()
+            if done < len(batch):
+                attempts = 0 if done else attempts + 1
+                time.sleep(backoff)
+                backoff = min(backoff * 2, WRITE_RETRY_MAX_MS / 1000)
+            else:
+                attempts = 0
+                backoff = WRITE_RETRY_MS / 1000
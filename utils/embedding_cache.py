@@ -0,0 +1,205 @@
+# utils/embedding_cache.py
+import os
+import json
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+
+# ================================
+#  Chunk-level embedding cache
+# ================================
+# Vectors live in fixed-size memory-mapped float32 blocks (block_00000.f32, ...).
+# A compact key index (16-byte digest -> slot, kept in LRU order) is saved as keys.npy.
+# Not safe for concurrent writers: each ingestion worker process gets its own directory.
+# store() only writes rows into the memmaps; the touched blocks and the key index are
+# persisted every FLUSH_EVERY_STORES calls, after each ingestion and at exit. A crash
+# in between loses only the unsaved entries: slots are recycled in batches of
+# EVICT_ROWS, and the key index is saved without them before any is overwritten, so a
+# saved key never points at another text's vector.
+CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "data/embedding_cache")
+BLOCK_ROWS = 4096
+MAX_ENTRIES = 200_000
+FLUSH_EVERY_STORES = 32
+EVICT_ROWS = 1024
+
+_KEY_DTYPE = np.dtype([("key", "S16"), ("slot", "<i4")])
+
+
+def make_key(model_name: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{model_name}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str = CACHE_DIR, max_entries: int = MAX_ENTRIES, block_rows: int = BLOCK_ROWS):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.block_rows = block_rows
+        self.dim = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()  # key -> slot, least recently used first
+        self._blocks = {}
+        self._next_slot = 0
+        self._free = []  # slots no saved key refers to
+        self._dirty_blocks = set()
+        self._unsaved_stores = 0
+        self._load()
+
+    # ---------- persistence ----------
+    def _meta_path(self):
+        return os.path.join(self.cache_dir, "meta.json")
+
+    def _keys_path(self):
+        return os.path.join(self.cache_dir, "keys.npy")
+
+    def _block_path(self, block_no):
+        return os.path.join(self.cache_dir, f"block_{block_no:05d}.f32")
+
+    def _load(self):
+        try:
+            with open(self._meta_path(), "r") as f:
+                meta = json.load(f)
+            if meta.get("block_rows") != self.block_rows:
+                return
+            keys = np.load(self._keys_path())
+        except (OSError, ValueError):
+            return
+        self.dim = meta["dim"]
+        for key, slot in zip(keys["key"], keys["slot"]):
+            slot = int(slot)
+            if slot < self.max_entries:
+                self._lru[bytes(key).ljust(16, b"\0")] = slot  # numpy strips trailing NUL bytes
+        self._next_slot = max(self._lru.values(), default=-1) + 1
+        self._free = sorted(set(range(self._next_slot)) - set(self._lru.values()))
+
+    def _block(self, block_no):
+        block = self._blocks.get(block_no)
+        if block is None:
+            path = self._block_path(block_no)
+            mode = "r+" if os.path.exists(path) else "w+"
+            block = np.memmap(path, dtype=np.float32, mode=mode, shape=(self.block_rows, self.dim))
+            self._blocks[block_no] = block
+        return block
+
+    def _flush(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Vectors first: the saved key index must never refer to rows not yet on disk
+        for block_no in self._dirty_blocks:
+            self._blocks[block_no].flush()
+        self._dirty_blocks.clear()
+        self._unsaved_stores = 0
+        keys = np.empty(len(self._lru), dtype=_KEY_DTYPE)
+        keys["key"] = list(self._lru.keys())
+        keys["slot"] = list(self._lru.values())
+        tmp = self._keys_path() + ".tmp.npy"
+        np.save(tmp, keys)
+        os.replace(tmp, self._keys_path())
+        with open(self._meta_path(), "w") as f:
+            json.dump({"dim": self.dim, "block_rows": self.block_rows}, f)
+
+    def _allocate(self) -> int:
+        if self._free:
+            return self._free.pop()
+        if self._next_slot < self.max_entries:
+            self._next_slot += 1
+            return self._next_slot - 1
+        # Size bound reached: evict a batch of least recently used entries and save the
+        # key index without them, so their slots can be overwritten safely
+        for _ in range(min(EVICT_ROWS, len(self._lru))):
+            self._free.append(self._lru.popitem(last=False)[1])
+        self._flush()
+        return self._free.pop()
+
+    def _reset(self, dim):
+        """Drop every entry (used when the embedding dimension changes)"""
+        self._blocks.clear()
+        self._lru.clear()
+        self._next_slot = 0
+        self._free = []
+        self._dirty_blocks.clear()
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.startswith("block_"):
+                    os.remove(os.path.join(self.cache_dir, name))
+        self.dim = dim
+
+    # ---------- public API ----------
+    def lookup(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        """Return a copy of each cached vector, or None for misses"""
+        out = []
+        with self._lock:
+            for key in keys:
+                slot = self._lru.get(key)
+                if slot is None:
+                    self.misses += 1
+                    out.append(None)
+                    continue
+                self._lru.move_to_end(key)
+                self.hits += 1
+                block = self._block(slot // self.block_rows)
+                out.append(np.array(block[slot % self.block_rows]))
+        return out
+
+    def store(self, keys: List[bytes], vectors: np.ndarray):
+        if not keys:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dim != vectors.shape[1]:
+                self._reset(vectors.shape[1])
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for key, vec in zip(keys, vectors):
+                slot = self._lru.get(key)
+                if slot is None:
+                    slot = self._allocate()
+                self._lru[key] = slot
+                self._lru.move_to_end(key)
+                self._block(slot // self.block_rows)[slot % self.block_rows] = vec
+                self._dirty_blocks.add(slot // self.block_rows)
+            self._unsaved_stores += 1
+            if self._unsaved_stores >= FLUSH_EVERY_STORES:
+                self._flush()
+
+    def flush(self):
+        """Persist the rows stored since the last flush and the key index"""
+        with self._lock:
+            if self._unsaved_stores:
+                self._flush()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._lru)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
+
+
+def flush_embedding_cache():
+    """Persist the process-wide cache, if one was opened (after ingestion, at exit)"""
+    if _cache is not None:
+        _cache.flush()
+
+
+atexit.register(flush_embedding_cache)
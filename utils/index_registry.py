@@ -0,0 +1,191 @@
+# utils/index_registry.py
+import os
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+# ================================
+#  Process-wide shared index registry
+# ================================
+# Sessions that process the same documents with the same settings share one
+# (index, chunk store, BM25) entry instead of each holding a private copy in
+# st.session_state. Entries are reference counted; unreferenced entries stay cached
+# until the memory budget is exceeded, then the least recently used go first.
+INDEX_MEMORY_BUDGET_MB = int(os.getenv("INDEX_MEMORY_BUDGET_MB", 1024))
+
+
+def registry_key(content_keys: List[str], *settings) -> str:
+    """Key for an ordered set of documents (content_key per file) plus index settings"""
+    h = hashlib.sha256()
+    for part in list(content_keys) + [str(s) for s in settings]:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _index_nbytes(index) -> int:
+    if index is None:
+        return 0
+    try:
+        per_vector = index.sa_code_size()
+    except Exception:
+        per_vector = index.d * 4
+    return int(index.ntotal * per_vector)
+
+
+class IndexEntry:
+    def __init__(self, key, index, docs, bm25):
+        self.key = key
+        self.index = index
+        self.docs = docs
+        self.bm25 = bm25
+        self.refcount = 0
+        docs_bytes = docs.nbytes() if hasattr(docs, "nbytes") else sum(len(d) for d in docs)
+        bm25_bytes = getattr(bm25, "nbytes", lambda: 0)() if bm25 is not None else 0
+        self.nbytes = _index_nbytes(index) + docs_bytes + bm25_bytes
+
+
+class IndexHandle:
+    """What a session keeps: a reference to a shared entry, released explicitly or on GC"""
+
+    def __init__(self, registry: "IndexRegistry", entry: IndexEntry):
+        self._entry = entry
+        self._finalizer = weakref.finalize(self, registry._release, entry.key)
+
+    @property
+    def key(self):
+        return self._entry.key
+
+    @property
+    def index(self):
+        return self._entry.index
+
+    @property
+    def docs(self):
+        return self._entry.docs
+
+    @property
+    def bm25(self):
+        return self._entry.bm25
+
+    def release(self):
+        self._finalizer()  # runs at most once
+
+    @property
+    def released(self) -> bool:
+        return not self._finalizer.alive
+
+
+class IndexRegistry:
+    def __init__(self, budget_bytes: int = INDEX_MEMORY_BUDGET_MB * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> IndexEntry, least recently used first
+        self._build_locks = {}  # key -> [lock, sessions using it]; dropped when the last one leaves
+
+    def _acquire_locked(self, key) -> Optional[IndexHandle]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        entry.refcount += 1
+        self._entries.move_to_end(key)
+        return IndexHandle(self, entry)
+
+    def get(self, key: str) -> Optional[IndexHandle]:
+        """Handle to an existing entry, or None"""
+        with self._lock:
+            handle = self._acquire_locked(key)
+            if handle is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return handle
+
+    def acquire(self, key: str,
+                builder: Callable[[], Optional[Tuple[object, object, object]]]) -> Optional[IndexHandle]:
+        """Handle to the entry for `key`, calling builder() -> (index, docs, bm25) if it is missing.
+
+        Concurrent sessions asking for the same missing key build it only once; the
+        others wait and share the result. None (nothing cached) if builder() returns None.
+        """
+        handle = self.get(key)
+        if handle is not None:
+            return handle
+        with self._lock:
+            slot = self._build_locks.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+        try:
+            with slot[0]:
+                with self._lock:
+                    handle = self._acquire_locked(key)
+                    if handle is not None:
+                        self.hits += 1  # built by the session we waited for
+                        self.misses -= 1
+                if handle is not None:
+                    return handle
+                built = builder()
+                return None if built is None else self.put(key, *built)
+        finally:
+            # Whether the build succeeded, found nothing or raised, the lock goes with its last user
+            with self._lock:
+                slot[1] -= 1
+                if not slot[1]:
+                    del self._build_locks[key]
+
+    def put(self, key: str, index, docs, bm25=None) -> IndexHandle:
+        entry = IndexEntry(key, index, docs, bm25)
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                entry = existing
+            else:
+                self._entries[key] = entry
+            entry.refcount += 1
+            self._entries.move_to_end(key)
+            self._evict_locked()
+            return IndexHandle(self, entry)
+
+    def _release(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.refcount > 0:
+                entry.refcount -= 1
+            self._evict_locked()
+
+    def _evict_locked(self):
+        total = sum(e.nbytes for e in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.budget_bytes:
+                break
+            entry = self._entries[key]
+            if entry.refcount == 0:  # entries a session still holds are never evicted
+                total -= entry.nbytes
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "in_use": sum(1 for e in self._entries.values() if e.refcount),
+                "bytes": sum(e.nbytes for e in self._entries.values()),
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_index_registry() -> IndexRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = IndexRegistry()
+    return _registry
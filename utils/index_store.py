@@ -0,0 +1,69 @@
+# utils/index_store.py
+import os
+import json
+import hashlib
+from typing import Optional, Tuple
+import faiss
+from utils.chunk_store import ChunkStore
+
+# ================================
+#  On-disk, content-addressed index store
+# ================================
+INDEX_DIR = "data/indexes"
+STORE_VERSION = 3  # bump when the chunking/index format changes
+
+
+def content_key(file_bytes: bytes, chunk_size: int, overlap: int, model_name: str) -> str:
+    """SHA-256 of the file bytes plus every setting that changes the resulting index"""
+    h = hashlib.sha256()
+    h.update(file_bytes)
+    h.update(f"|v{STORE_VERSION}|{int(chunk_size)}|{int(overlap)}|{model_name}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def index_path(key: str) -> str:
+    return os.path.join(INDEX_DIR, f"{key}.faiss")
+
+
+def chunks_path(key: str) -> str:
+    return os.path.join(INDEX_DIR, f"{key}.chunks.json")
+
+
+def save_index(key: str, index, store: ChunkStore) -> str:
+    """Write the FAISS index and its chunk store; returns the index path"""
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    path = index_path(key)
+    # Write to temp names first so a crash never leaves a half-written entry behind
+    tmp_index, tmp_chunks = path + ".tmp", chunks_path(key) + ".tmp"
+    faiss.write_index(index, tmp_index)
+    with open(tmp_chunks, "w", encoding="utf-8") as f:
+        json.dump(store.to_dict(), f)
+    os.replace(tmp_chunks, chunks_path(key))
+    os.replace(tmp_index, path)
+    return path
+
+
+def has_index(key: str) -> bool:
+    return os.path.exists(index_path(key)) and os.path.exists(chunks_path(key))
+
+
+def load_index(key: str) -> Optional[Tuple[object, ChunkStore]]:
+    """Return (index, chunk store) for a stored key, or None if missing or unreadable"""
+    path, cpath = index_path(key), chunks_path(key)
+    if not (os.path.exists(path) and os.path.exists(cpath)):
+        return None
+    try:
+        index = faiss.read_index(path)
+        with open(cpath, "r", encoding="utf-8") as f:
+            store = ChunkStore.from_dict(json.load(f))
+    except Exception:
+        return None
+    if index.ntotal != len(store):
+        return None
+    return index, store
+
+
+def delete_index(key: str):
+    for path in (index_path(key), chunks_path(key)):
+        if os.path.exists(path):
+            os.remove(path)
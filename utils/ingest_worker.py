@@ -0,0 +1,177 @@
+# utils/ingest_worker.py
+"""Background PDF ingestion workers.
+
+Process PDFs enqueues one job per new file (a `documents` row with status 'queued'
+and the upload saved under data/uploads/). Worker processes claim jobs oldest first,
+run extract -> chunk -> embed -> index, record progress for the RAG page to poll and
+save the finished index to the on-disk store, where the page loads it like any other
+stored index. A rerun or disconnect does not lose the work, and ingestion never uses
+more than INGEST_WORKERS processes x INGEST_THREADS threads, whoever is uploading.
+
+The app starts the workers itself (ensure_workers); they exit when the app does.
+Set SMARTAI_BACKGROUND_INGEST=0 to ingest inline in the page instead.
+
+Usage (from the project root, to run workers without the app):
+    python -m utils.ingest_worker --workers 2
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from utils.db import (
+    init_db, enqueue_ingest_job, get_active_ingest_job, claim_ingest_job, update_ingest_progress,
+    finish_ingest_job, fail_ingest_job, requeue_stale_ingest_jobs
+)
+
+BACKGROUND_INGEST = os.getenv("SMARTAI_BACKGROUND_INGEST", "1") != "0"
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+INGEST_THREADS = int(os.getenv("INGEST_THREADS", 2))  # torch / BLAS threads per worker
+UPLOAD_DIR = "data/uploads"
+POLL_SECONDS = 1.0
+PROGRESS_SECONDS = 1.0  # minimum interval between progress writes
+STALE_SECONDS = 300  # a running job without a heartbeat for this long is requeued
+MAX_ATTEMPTS = 3
+
+
+def upload_path(key: str) -> str:
+    return os.path.join(UPLOAD_DIR, f"{key}.pdf")
+
+
+def save_upload(key: str, file_bytes: bytes) -> str:
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    path = upload_path(key)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(file_bytes)
+    os.replace(tmp, path)
+    return path
+
+
+def discard_upload(job):
+    """Delete a job's saved PDF once it is no longer needed (finished or failed for good)"""
+    try:
+        os.remove(job["upload_path"])
+    except (OSError, TypeError):  # already gone, or the job never had one
+        pass
+
+
+def submit_upload(username, filename, file_bytes, key, chunk_size, overlap, model_name) -> int:
+    """Job id for this upload, reusing a job already queued or running for the same bytes + settings"""
+    job = get_active_ingest_job(key)
+    if job is not None:
+        return job["id"]
+    path = save_upload(key, file_bytes)
+    return enqueue_ingest_job(username, filename, key, chunk_size, overlap, model_name, path)
+
+
+# ================================
+#  Worker side
+# ================================
+def run_job(job):
+    """Ingest one claimed job and hand the index back through the on-disk store"""
+    from utils.rag_pdf_utils import count_pdf_pages, iter_pdf_pages, ingest_pages
+    from utils.index_store import save_index
+
+    with open(job["upload_path"], "rb") as f:
+        file_bytes = f.read()
+    total_pages = count_pdf_pages(file_bytes)
+    update_ingest_progress(job["id"], 0, total_pages, 0)
+    last = time.monotonic()
+
+    def report(pages_done, chunks_done):
+        nonlocal last
+        now = time.monotonic()
+        if now - last >= PROGRESS_SECONDS:
+            last = now
+            update_ingest_progress(job["id"], pages_done, total_pages, chunks_done)
+
+    index, store = ingest_pages(iter_pdf_pages(file_bytes), job["chunk_size"], job["overlap"],
+                                doc_name=job["filename"], progress_callback=report)
+    if index is None:
+        raise ValueError(f"No text found in {job['filename']}")
+    store.doc_keys[0] = job["content_hash"]
+    path = save_index(job["content_hash"], index, store)
+    finish_ingest_job(job["id"], len(store), path)
+    discard_upload(job)
+
+
+def worker_loop(slot: int = 0, parent_pid: int = None):
+    init_db()
+    pid = os.getpid()
+    while parent_pid is None or os.getppid() == parent_pid:
+        if slot == 0:
+            for failed in requeue_stale_ingest_jobs(STALE_SECONDS, MAX_ATTEMPTS):
+                if get_active_ingest_job(failed["content_hash"]) is None:  # not re-uploaded meanwhile
+                    discard_upload(failed)
+        job = claim_ingest_job(pid)
+        if job is None:
+            time.sleep(POLL_SECONDS)
+            continue
+        try:
+            run_job(job)
+        except Exception as e:
+            traceback.print_exc()
+            discard_upload(job)  # before the job stops being active, so a re-upload cannot race it
+            fail_ingest_job(job["id"], str(e) or type(e).__name__)
+
+
+# ================================
+#  App side: worker process pool
+# ================================
+_workers = {}  # slot -> Popen
+_workers_lock = threading.Lock()
+
+
+def _worker_env(slot: int) -> dict:
+    env = dict(os.environ)
+    env.update(
+        OMP_NUM_THREADS=str(INGEST_THREADS),
+        MKL_NUM_THREADS=str(INGEST_THREADS),
+        PDF_EXTRACT_WORKERS="1",
+        # The embedding cache's memmap blocks are not safe for concurrent writers
+        EMBEDDING_CACHE_DIR=os.path.join(os.getenv("EMBEDDING_CACHE_DIR", "data/embedding_cache"),
+                                         f"worker-{slot}"),
+    )
+    return env
+
+
+def ensure_workers(n: int = INGEST_WORKERS):
+    """Start (or restart) the worker processes owned by this app process"""
+    with _workers_lock:
+        for slot in range(n):
+            proc = _workers.get(slot)
+            if proc is not None and proc.poll() is None:
+                continue
+            _workers[slot] = subprocess.Popen(
+                [sys.executable, "-m", "utils.ingest_worker", "--slot", str(slot), "--parent-pid", str(os.getpid())],
+                env=_worker_env(slot),
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes to run in the foreground")
+    parser.add_argument("--slot", type=int, default=0)
+    parser.add_argument("--parent-pid", type=int, default=None, help="exit when this process goes away")
+    args = parser.parse_args()
+
+    if args.parent_pid is not None or args.workers == 1:
+        try:
+            worker_loop(args.slot, args.parent_pid)
+        except KeyboardInterrupt:
+            pass
+        return
+    ensure_workers(args.workers)
+    try:
+        while True:
+            time.sleep(POLL_SECONDS)
+            ensure_workers(args.workers)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
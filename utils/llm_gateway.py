@@ -0,0 +1,264 @@
+# utils/llm_gateway.py
+import os
+import json
+import time
+import random
+import threading
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Iterator, Optional
+import groq
+from utils.metrics import METRICS_ENABLED, incr, observe
+
+# ================================
+#  Process-wide LLM gateway
+# ================================
+# One pooled Groq client (HTTP keep-alive) serves every session. Calls run on a shared
+# thread pool, at most LLM_MODEL_CONCURRENCY at a time per model, paced by per-model
+# token buckets (requests and prompt tokens per minute; 0 = unlimited). 429 / 5xx /
+# connection errors are retried with full-jitter exponential backoff, and identical
+# requests already in flight share one upstream call (streams are replayed to every
+# consumer). The gateway exposes chat.completions.create(...), so it drops in for Groq().
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", 32))
+LLM_MODEL_CONCURRENCY = int(os.getenv("LLM_MODEL_CONCURRENCY", 8))
+LLM_RPM = float(os.getenv("LLM_RPM", 0))
+LLM_TPM = float(os.getenv("LLM_TPM", 0))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 4))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 20.0
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+BURST_SECONDS = 10  # token buckets hold this many seconds of allowance
+
+
+class TokenBucket:
+    """Blocking token bucket refilled continuously at `rate_per_minute`"""
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(self.rate * BURST_SECONDS, 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, n: float = 1.0):
+        n = min(n, self.capacity)  # an oversized request must still be able to go eventually
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return
+                wait = (n - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _estimate_prompt_tokens(request: dict) -> int:
+    return sum(len(str(m.get("content", ""))) for m in request.get("messages", [])) // 4 + 1
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, groq.APIConnectionError):  # includes timeouts
+        return True
+    return isinstance(exc, groq.APIStatusError) and exc.status_code in RETRYABLE_STATUS
+
+
+def _retry_delay(exc: Exception, attempt: int) -> float:
+    backoff = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after")) + backoff * 0.1
+    except (TypeError, ValueError):
+        return backoff
+
+
+def _record_usage(obj):
+    usage = getattr(obj, "usage", None) or getattr(getattr(obj, "x_groq", None), "usage", None)
+    if usage is not None:
+        incr("llm_prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+        incr("llm_completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+
+
+def _request_key(request: dict, stream: bool) -> str:
+    return json.dumps([stream, request], sort_keys=True, default=str)
+
+
+class _SharedStream:
+    """Chunks of one upstream stream, replayable by every coalesced consumer"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self._cond = threading.Condition()
+
+    def push(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error: Exception = None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def __iter__(self) -> Iterator:
+        i = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: i < len(self.chunks) or self.done)
+                if i < len(self.chunks):
+                    chunk = self.chunks[i]
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            i += 1
+            yield chunk
+
+
+class LLMGateway:
+    def __init__(self, api_key: str, base_url: Optional[str] = None,
+                 max_workers: int = LLM_MAX_WORKERS, model_concurrency: int = LLM_MODEL_CONCURRENCY,
+                 rpm: float = LLM_RPM, tpm: float = LLM_TPM, max_retries: int = LLM_MAX_RETRIES):
+        # The SDK's own retries are off: backoff happens here, outside the HTTP call
+        self._client = groq.Groq(api_key=api_key, base_url=base_url or GROQ_BASE_URL, max_retries=0,
+                                 timeout=LLM_TIMEOUT)
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix="llm-gateway")
+        self.model_concurrency = model_concurrency
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._inflight = {}  # request key -> Future / _SharedStream
+        self._limits = {}  # model -> (semaphore, request bucket, token bucket)
+        self._counters = defaultdict(int)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._counters[name] += n
+        incr(f"llm_{name}", n)
+
+    def _model_limits(self, model: str):
+        with self._lock:
+            limits = self._limits.get(model)
+            if limits is None:
+                limits = self._limits[model] = (
+                    threading.BoundedSemaphore(self.model_concurrency),
+                    TokenBucket(self.rpm) if self.rpm else None,
+                    TokenBucket(self.tpm) if self.tpm else None,
+                )
+            return limits
+
+    def _call(self, request: dict, on_chunk=None):
+        """Run one upstream request under the model's limits, retrying transient failures"""
+        semaphore, requests_bucket, tokens_bucket = self._model_limits(request.get("model"))
+        with semaphore:
+            for attempt in range(self.max_retries + 1):
+                if requests_bucket:
+                    requests_bucket.acquire(1)
+                if tokens_bucket:
+                    tokens_bucket.acquire(_estimate_prompt_tokens(request))
+                started = False
+                t0 = time.perf_counter()
+                try:
+                    self._count("upstream")
+                    if on_chunk is None:
+                        response = self._client.chat.completions.create(**request)
+                        if METRICS_ENABLED:
+                            observe("llm_call", time.perf_counter() - t0)
+                            _record_usage(response)
+                        return response
+                    for chunk in self._client.chat.completions.create(stream=True, **request):
+                        if not started and METRICS_ENABLED:
+                            observe("llm_first_chunk", time.perf_counter() - t0)
+                        started = True
+                        if METRICS_ENABLED:
+                            _record_usage(chunk)
+                        on_chunk(chunk)
+                    observe("llm_stream", time.perf_counter() - t0)
+                    return None
+                except Exception as exc:
+                    # A stream that already produced output cannot be replayed transparently
+                    if started or attempt == self.max_retries or not _is_retryable(exc):
+                        self._count("errors")
+                        raise
+                    self._count("retries")
+                    time.sleep(_retry_delay(exc, attempt))
+
+    def _forget(self, key: str, owner):
+        with self._lock:
+            if self._inflight.get(key) is owner:
+                del self._inflight[key]
+
+    def submit(self, **request) -> Future:
+        """Schedule a non-streaming completion; identical in-flight requests share one Future"""
+        key = _request_key(request, False)
+        with self._lock:
+            self._counters["requests"] += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self._counters["coalesced"] += 1
+                incr("llm_coalesced")
+                return future
+            future = self._inflight[key] = self._pool.submit(self._call, request)
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return future
+
+    def complete(self, **request):
+        return self.submit(**request).result()
+
+    def stream(self, **request) -> Iterator:
+        """Chunks of a streaming completion; identical in-flight streams share one upstream call"""
+        key = _request_key(request, True)
+        with self._lock:
+            self._counters["requests"] += 1
+            shared = self._inflight.get(key)
+            if shared is not None:
+                self._counters["coalesced"] += 1
+                incr("llm_coalesced")
+                return iter(shared)
+            shared = self._inflight[key] = _SharedStream()
+
+        def run():
+            try:
+                self._call(request, on_chunk=shared.push)
+                shared.finish()
+            except Exception as exc:
+                shared.finish(exc)
+            finally:
+                self._forget(key, shared)
+
+        self._pool.submit(run)
+        return iter(shared)
+
+    def create(self, stream: bool = False, **request):
+        """Groq-compatible entry point (client.chat.completions.create)"""
+        return self.stream(**request) if stream else self.complete(**request)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"in_flight": len(self._inflight), **self._counters}
+
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+def get_llm_gateway(api_key: Optional[str] = None, base_url: Optional[str] = None) -> LLMGateway:
+    api_key = api_key or os.getenv("GROQ_API_KEY")
+    base_url = base_url or GROQ_BASE_URL
+    key = (api_key, base_url)
+    gateway = _gateways.get(key)
+    if gateway is None:
+        with _gateways_lock:
+            gateway = _gateways.get(key)
+            if gateway is None:
+                gateway = _gateways[key] = LLMGateway(api_key, base_url)
+    return gateway
@@ -0,0 +1,100 @@
+# utils/llm_utils.py
+import os
+import threading
+import time
+from collections import deque
+from typing import Iterator, Optional
+from utils.metrics import observe
+
+# ================================
+#  Streaming chat completions
+# ================================
+# CompletionStream wraps client.chat.completions.create(stream=True, ...) as an
+# iterator of text deltas (what st.write_stream consumes) and records time to first
+# token and total latency. With LLM_STREAMING=0 it makes one blocking call and yields
+# the whole answer at once, so callers do not need two code paths.
+LLM_STREAMING = os.getenv("LLM_STREAMING", "1") != "0"
+TIMING_HISTORY = 256
+
+_timings = deque(maxlen=TIMING_HISTORY)
+_timings_lock = threading.Lock()
+
+
+def _usage_tokens(chunk) -> Optional[int]:
+    usage = getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None)
+    return getattr(usage, "completion_tokens", None) if usage is not None else None
+
+
+class CompletionStream:
+    def __init__(self, client, stream: bool = LLM_STREAMING, **request):
+        self._client = client
+        self.stream = stream
+        self.request = request
+        self.parts = []
+        self.ttft = None
+        self.total = None
+        self.completion_tokens = None
+
+    def __iter__(self) -> Iterator[str]:
+        start = time.perf_counter()
+        if not self.stream:
+            resp = self._client.chat.completions.create(**self.request)
+            self.ttft = time.perf_counter() - start
+            self.completion_tokens = _usage_tokens(resp)
+            self.parts.append(resp.choices[0].message.content or "")
+            yield self.parts[-1]
+        else:
+            for chunk in self._client.chat.completions.create(stream=True, **self.request):
+                tokens = _usage_tokens(chunk)
+                if tokens is not None:
+                    self.completion_tokens = tokens
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                if self.ttft is None:
+                    self.ttft = time.perf_counter() - start
+                self.parts.append(delta)
+                yield delta
+        self.total = time.perf_counter() - start
+        if self.ttft is not None:
+            observe("llm_ttft", self.ttft)
+        observe("llm_answer", self.total)
+        _record(self.timing())
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts).strip()
+
+    def timing(self) -> dict:
+        return {
+            "model": self.request.get("model"),
+            "stream": self.stream,
+            "ttft": self.ttft,
+            "total": self.total,
+            "completion_tokens": self.completion_tokens,
+        }
+
+
+def _record(timing: dict):
+    with _timings_lock:
+        _timings.append(timing)
+
+
+def recent_timings() -> list:
+    """Timings of the last TIMING_HISTORY completions in this process, oldest first"""
+    with _timings_lock:
+        return list(_timings)
+
+
+def format_timing(timing: dict) -> str:
+    if timing.get("total") is None:
+        return ""
+    if timing.get("cached"):
+        return f"⚡ cached answer · {timing['total']:.2f}s"
+    parts = []
+    if timing.get("ttft") is not None:
+        parts.append(f"first token {timing['ttft']:.2f}s")
+    parts.append(f"total {timing['total']:.2f}s")
+    if timing.get("completion_tokens"):
+        parts.append(f"{timing['completion_tokens'] / timing['total']:.0f} tok/s")
+    return "⏱️ " + " · ".join(parts)
@@ -0,0 +1,188 @@
+# utils/metrics.py
+import os
+import json
+import time
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ================================
+#  Per-stage timings and counters (process-wide)
+# ================================
+# span("embed_texts") / @timed("embed_texts") record monotonic durations into a ring
+# buffer per stage (p50/p95/p99 over the last METRICS_WINDOW samples); incr() bumps
+# counters (chunks, tokens, cache hits). Off unless SMARTAI_METRICS=1: span() then
+# returns a shared no-op context and @timed leaves the function undecorated.
+# With SMARTAI_METRICS_PORT set, GET /metrics (Prometheus text) and /metrics.json
+# serve a snapshot from 127.0.0.1.
+METRICS_ENABLED = os.getenv("SMARTAI_METRICS", "0") == "1"
+METRICS_PORT = int(os.getenv("SMARTAI_METRICS_PORT", 0))
+METRICS_WINDOW = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+
+_NOOP = nullcontext()
+
+
+class _Stage:
+    __slots__ = ("count", "total", "max", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=METRICS_WINDOW)
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = defaultdict(_Stage)
+        self._counters = defaultdict(float)
+        self.started_at = time.time()
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            s = self._stages[stage]
+            s.count += 1
+            s.total += seconds
+            s.max = max(s.max, seconds)
+            s.samples.append(seconds)
+
+    def incr(self, name: str, n: float = 1):
+        with self._lock:
+            self._counters[name] += n
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self.started_at = time.time()
+
+    def snapshot(self) -> dict:
+        """{"stages": {name: {count, total, mean, max, p50, p95, p99}}, "counters": {...}} (seconds)"""
+        with self._lock:
+            stages = {name: (s.count, s.total, s.max, sorted(s.samples)) for name, s in self._stages.items()}
+            counters = dict(self._counters)
+        out = {}
+        for name, (count, total, peak, samples) in sorted(stages.items()):
+            entry = {"count": count, "total": total, "mean": total / count if count else 0.0, "max": peak}
+            for q in QUANTILES:
+                # nearest rank over the recent window
+                entry[f"p{round(q * 100)}"] = samples[min(int(q * len(samples)), len(samples) - 1)] if samples else 0.0
+            out[name] = entry
+        return {"enabled": METRICS_ENABLED, "uptime": time.time() - self.started_at,
+                "stages": out, "counters": dict(sorted(counters.items()))}
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+
+@contextmanager
+def _span(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _metrics.observe(stage, time.perf_counter() - start)
+
+
+def span(stage: str):
+    """Context manager timing its block as one sample of `stage`"""
+    return _span(stage) if METRICS_ENABLED else _NOOP
+
+
+def timed(stage: str = None):
+    """Decorator timing every call; a no-op (the function itself) when metrics are off"""
+    def decorate(fn):
+        if not METRICS_ENABLED:
+            return fn
+        name = stage or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _metrics.observe(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def observe(stage: str, seconds: float):
+    if METRICS_ENABLED:
+        _metrics.observe(stage, seconds)
+
+
+def incr(name: str, n: float = 1):
+    if METRICS_ENABLED:
+        _metrics.incr(name, n)
+
+
+# ================================
+#  Export
+# ================================
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def to_prometheus(snapshot: dict = None) -> str:
+    snap = snapshot or _metrics.snapshot()
+    lines = ["# HELP smartai_stage_seconds Time spent per pipeline stage.",
+             "# TYPE smartai_stage_seconds summary"]
+    for name, s in snap["stages"].items():
+        stage = _label(name)
+        for q in QUANTILES:
+            lines.append(f'smartai_stage_seconds{{stage="{stage}",quantile="{q}"}} {s[f"p{round(q * 100)}"]:.6f}')
+        lines.append(f'smartai_stage_seconds_sum{{stage="{stage}"}} {s["total"]:.6f}')
+        lines.append(f'smartai_stage_seconds_count{{stage="{stage}"}} {s["count"]}')
+    lines += ["# HELP smartai_events_total Counted events (chunks, tokens, cache hits).",
+              "# TYPE smartai_events_total counter"]
+    for name, value in snap["counters"].items():
+        lines.append(f'smartai_events_total{{name="{_label(name)}"}} {value:g}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, ctype = to_prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, ctype = json.dumps(_metrics.snapshot()).encode("utf-8"), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "127.0.0.1"):
+    """Serve /metrics and /metrics.json once per process; returns the server or None"""
+    global _server
+    if not METRICS_ENABLED or not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError:  # port already taken (e.g. by another app process)
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server
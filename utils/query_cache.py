@@ -0,0 +1,76 @@
+# utils/query_cache.py
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+
+# ================================
+#  Query-embedding LRU cache (process-wide, shared by all sessions)
+# ================================
+QUERY_CACHE_SIZE = 4096
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING = re.compile(r"[\s?.!,;:]+$")
+
+
+def normalize_query(query: str) -> str:
+    """Case/whitespace/trailing-punctuation insensitive form of a question"""
+    query = _WHITESPACE.sub(" ", query.strip().lower())
+    return _TRAILING.sub("", query)
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_size: int = QUERY_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # normalized query -> L2-normalized float32 vector
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vec = self._entries.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vec.copy()
+
+    def put(self, key: str, vec: np.ndarray):
+        vec = np.asarray(vec, dtype=np.float32).copy()
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec /= norm
+        with self._lock:
+            self._entries[key] = vec
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> QueryEmbeddingCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = QueryEmbeddingCache()
+    return _cache
@@ -2,112 +2,512 @@
 
 # utils/rag_pdf_utils.py
 import os
-from typing import List, Tuple
+import tempfile
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import faiss
 from PyPDF2 import PdfReader
 from io import BytesIO
+from utils.embedding_cache import get_embedding_cache, flush_embedding_cache, make_key
+from utils.chunk_store import ChunkStore
+from utils.query_cache import get_query_cache, normalize_query
+from utils.bm25_index import BM25Index
+from utils.metrics import timed, incr
 
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
 _embedding_model = None
+_embedding_model_lock = threading.Lock()
+
+# Parallel PDF extraction (PyPDF2 is pure Python, so threads would serialize on the GIL)
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+PAGES_PER_TASK = 25
+
+# Index backends. "auto" keeps exact Flat search until the corpus reaches ANN_AUTO_THRESHOLD chunks
+INDEX_MODES = ("auto", "flat", "ivf_flat", "ivf_pq", "hnsw")
+ANN_AUTO_THRESHOLD = int(os.getenv("ANN_AUTO_THRESHOLD", 50_000))
+ANN_AUTO_MODE = os.getenv("ANN_AUTO_MODE", "ivf_flat")
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+
+# Retrieval modes: dense (FAISS), bm25 (lexical) or hybrid (weighted fusion of both)
+RETRIEVAL_MODES = ("dense", "bm25", "hybrid")
+HYBRID_ALPHA = 0.5  # weight of the dense score in hybrid mode
+HYBRID_CANDIDATES = 4  # each side contributes top_k * this many candidates before fusion
+
+# Streaming ingestion: chunks are embedded and indexed this many at a time
+EMBED_BATCH_SIZE = 64
 
 def get_embedding_model():
     global _embedding_model
     if _embedding_model is None:
-        _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        with _embedding_model_lock:
+            if _embedding_model is None:
+                # Imported here: sentence-transformers pulls in torch, which takes seconds
+                from sentence_transformers import SentenceTransformer
+                _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
     return _embedding_model
 
-def load_pdf_bytes(file_bytes: bytes) -> str:
-    stream = BytesIO(file_bytes)
-    reader = PdfReader(stream)
+def _extract_pages(file_bytes: bytes, start: int = 0, end: Optional[int] = None) -> List[str]:
+    """Extract pages[start:end]; a page that fails to parse yields an empty string"""
+    return _extract_reader_pages(PdfReader(BytesIO(file_bytes)), start, end)
+
+def _extract_reader_pages(reader: PdfReader, start: int = 0, end: Optional[int] = None) -> List[str]:
+    pages = reader.pages
+    end = len(pages) if end is None else min(end, len(pages))
     texts = []
-    for page in reader.pages:
+    for i in range(start, end):
         try:
-            texts.append(page.extract_text() or "")
+            texts.append(pages[i].extract_text() or "")
         except Exception:
             texts.append("")
-    return "\n\n".join(texts)
+    return texts
 
-def simple_text_split(text: str, chunk_size: int = 800, overlap: int = 150) -> List[str]:
-    text = text.replace("\r", "\n")
-    paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
-    chunks = []
-    current = ""
-    for p in paragraphs:
-        if len(current) + len(p) + 2 <= chunk_size:
-            current = (current + "\n\n" + p).strip()
-        else:
-            if current:
-                chunks.append(current)
-            if len(p) > chunk_size:
-                for i in range(0, len(p), chunk_size - overlap):
-                    chunks.append(p[i:i+chunk_size].strip())
-                current = ""
-            else:
-                current = p
-    if current:
-        chunks.append(current)
-
-    final = []
-    for i, c in enumerate(chunks):
-        if i == 0:
-            final.append(c)
-        else:
-            prev = final[-1]
-            if overlap > 0:
-                tail = prev[-overlap:]
-                merged = (tail + " \n\n" + c).strip()
-                final.append(merged)
+_task_readers = {}  # in pool workers: temp file path -> PdfReader, parsed once per worker
+
+def _extract_file_pages(path: str, start: int, end: int) -> List[str]:
+    """Pool task: pages[start:end] of a PDF the parent wrote to `path`"""
+    reader = _task_readers.get(path)
+    if reader is None:
+        reader = _task_readers[path] = PdfReader(path)
+    return _extract_reader_pages(reader, start, end)
+
+def count_pdf_pages(file_bytes: bytes) -> int:
+    return len(PdfReader(BytesIO(file_bytes)).pages)
+
+@timed("load_pdf_bytes")
+def load_pdf_bytes(file_bytes: bytes) -> str:
+    return "\n\n".join(_extract_pages(file_bytes))
+
+@timed("extract_pages_parallel")
+def extract_pages_parallel(files: List[bytes], max_workers: Optional[int] = None,
+                           pages_per_task: int = PAGES_PER_TASK) -> List[List[str]]:
+    """Extract the pages of several PDFs across a process pool.
+
+    Files larger than `pages_per_task` are split into page ranges so one big report
+    can use several cores. Each file is written to a temporary path once and tasks
+    carry only (path, page range), instead of pickling the whole PDF into every task.
+    Returns one list of page texts per file, in page order.
+    """
+    workers = max_workers or PDF_EXTRACT_WORKERS
+    tasks = []  # (file_no, start, end)
+    for file_no, file_bytes in enumerate(files):
+        n_pages = count_pdf_pages(file_bytes)
+        for start in range(0, max(n_pages, 1), pages_per_task):
+            tasks.append((file_no, start, start + pages_per_task))
+
+    results = [[] for _ in files]
+    if workers <= 1 or len(tasks) <= 1:
+        for file_no, start, end in tasks:
+            results[file_no].extend(_extract_pages(files[file_no], start, end))
+        return results
+
+    with tempfile.TemporaryDirectory(prefix="pdf_extract_") as tmp:
+        paths = []
+        for file_no, file_bytes in enumerate(files):
+            paths.append(os.path.join(tmp, f"{file_no}.pdf"))
+            with open(paths[-1], "wb") as f:
+                f.write(file_bytes)
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            futures = [pool.submit(_extract_file_pages, paths[file_no], start, end) for file_no, start, end in tasks]
+            # Tasks were queued in (file, page) order, so extending in submit order keeps pages ordered
+            for (file_no, _, _), fut in zip(tasks, futures):
+                results[file_no].extend(fut.result())
+    return results
+
+def load_pdfs_parallel(files: List[bytes], max_workers: Optional[int] = None) -> List[str]:
+    return ["\n\n".join(pages) for pages in extract_pages_parallel(files, max_workers)]
+
+def iter_pdf_pages(file_bytes: bytes) -> Iterator[str]:
+    """Yield page texts one at a time instead of materialising the whole document"""
+    reader = PdfReader(BytesIO(file_bytes))
+    for page in reader.pages:
+        try:
+            yield page.extract_text() or ""
+        except Exception:
+            yield ""
+
+def _paragraph_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """(start, end) of each non-blank, stripped paragraph in `text`"""
+    pos = 0
+    for part in text.split("\n\n"):
+        stripped = part.strip()
+        if stripped:
+            a = pos + len(part) - len(part.lstrip())
+            yield a, a + len(stripped)
+        pos += len(part) + 2
+
+def _iter_raw_spans(pages: Iterable[Tuple[int, str]], chunk_size: int, overlap: int) -> Iterator[Tuple[int, int]]:
+    current = None
+    current_len = 0  # length the paragraphs would have joined by a blank line
+    for base, text in pages:
+        # Pages are separated by a blank line, so each one starts a new paragraph
+        for a, b in _paragraph_spans(text):
+            p_len = b - a
+            if current_len + p_len + 2 <= chunk_size:
+                if current is None:
+                    current, current_len = (base + a, base + b), p_len
+                else:
+                    current, current_len = (current[0], base + b), current_len + p_len + 2
             else:
-                final.append(c)
-    return final
+                if current is not None:
+                    yield current
+                current, current_len = None, 0
+                if p_len > chunk_size:
+                    for i in range(a, b, chunk_size - overlap):
+                        piece = text[i:min(i + chunk_size, b)]
+                        stripped = piece.strip()
+                        if stripped:
+                            lead = len(piece) - len(piece.lstrip())
+                            yield base + i + lead, base + i + lead + len(stripped)
+                else:
+                    current, current_len = (base + a, base + b), p_len
+    if current is not None:
+        yield current
+
+def iter_chunk_spans(pages: Iterable[Tuple[int, str]], chunk_size: int = 800,
+                     overlap: int = 150) -> Iterator[Tuple[int, int, int]]:
+    """Stream (start, end, own_start) document offsets of each chunk.
+
+    `pages` yields (page offset, page text) pairs, e.g. from ChunkStore.iter_add_pages.
+    Each chunk after the first is extended back over the last `overlap` characters of
+    the previous chunk instead of storing a copy of that tail; own_start is where the
+    chunk began before that, which is what its page is cited from.
+    """
+    prev = None
+    for own_start, end in _iter_raw_spans(pages, chunk_size, overlap):
+        start = own_start
+        if prev is not None and overlap > 0:
+            start = min(start, max(prev[0], prev[1] - overlap))
+        prev = (start, end)
+        yield start, end, own_start
+
+@timed("simple_text_split")
+def simple_text_split(text: str, chunk_size: int = 800, overlap: int = 150) -> List[str]:
+    store = ChunkStore()
+    doc_id = store.add_document("text")
+    spans = iter_chunk_spans(store.iter_add_pages(doc_id, [text]), chunk_size, overlap)
+    return [store.slice(doc_id, start, end) for start, end, _ in spans]
+
+def iter_batches(items: Iterable, batch_size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-def embed_texts(texts: List[str]) -> np.ndarray:
+@timed("encode")
+def _encode(texts: List[str]) -> np.ndarray:
     model = get_embedding_model()
     emb = model.encode(texts, show_progress_bar=False, convert_to_numpy=True)
     return emb.astype('float32')
 
-def build_faiss_index(embeddings: np.ndarray) -> Tuple[faiss.IndexFlatIP, int]:
+@timed("embed_texts")
+def embed_texts(texts: List[str], use_cache: bool = True) -> np.ndarray:
+    incr("chunks_embedded", len(texts))
+    if not use_cache or not texts:
+        return _encode(texts)
+
+    # Only encode cache misses (deduplicated, one batch), then merge back in order
+    cache = get_embedding_cache()
+    keys = [make_key(EMBEDDING_MODEL_NAME, t) for t in texts]
+    cached = cache.lookup(keys)
+    missing = {}
+    for i, vec in enumerate(cached):
+        if vec is None:
+            missing.setdefault(keys[i], i)
+    incr("embedding_cache_hits", sum(vec is not None for vec in cached))
+    if missing:
+        miss_rows = list(missing.values())
+        new_emb = _encode([texts[i] for i in miss_rows])
+        cache.store(list(missing.keys()), new_emb)
+        fresh = dict(zip(missing.keys(), new_emb))
+        cached = [vec if vec is not None else fresh[keys[i]] for i, vec in enumerate(cached)]
+    return np.vstack(cached).astype('float32')
+
+def resolve_index_mode(mode: str, n_vectors: int) -> str:
+    """Map "auto" to a concrete backend: exact Flat for small corpora, ANN above the threshold"""
+    if mode not in INDEX_MODES:
+        raise ValueError(f"Unknown index mode: {mode!r} (expected one of {INDEX_MODES})")
+    if mode == "auto":
+        return "flat" if n_vectors < ANN_AUTO_THRESHOLD else ANN_AUTO_MODE
+    return mode
+
+def _ivf_nlist(n_vectors: int) -> int:
+    # ~4*sqrt(n) lists, but never fewer than ~39 training points per list
+    return int(max(1, min(4 * np.sqrt(n_vectors), n_vectors // 39)))
+
+# 8-bit PQ codebooks have 256 centroids per sub-quantizer, and k-means wants ~39
+# training points per centroid; with fewer, IVF-PQ is built as IVF-Flat instead
+PQ_MIN_TRAIN = 39 * 256
+
+def _pq_subquantizers(dim: int) -> int:
+    for m in (48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if dim % m == 0 and m <= dim:
+            return m
+    return 1
+
+@timed("build_faiss_index")
+def build_faiss_index(embeddings: np.ndarray, mode: str = "flat",
+                      ids: Optional[np.ndarray] = None) -> Tuple[faiss.Index, int]:
+    """Index of the requested type; with `ids`, vectors are added under those ids.
+
+    Flat and HNSW indexes are wrapped in an IndexIDMap2 for that. IVF indexes store
+    external ids themselves and are not wrapped: IndexIDMap2.remove_ids compacts its id
+    map, but IVF lists keep the old sequential ids, so results would map to the wrong
+    chunk after a removal.
+    """
     faiss.normalize_L2(embeddings)
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(embeddings)
+    n, dim = embeddings.shape
+    mode = resolve_index_mode(mode, n)
+    # PQ codebooks need PQ_MIN_TRAIN training points; IVF needs a few per list
+    if mode == "ivf_pq" and n < PQ_MIN_TRAIN:
+        mode = "ivf_flat"
+    if mode == "ivf_flat" and n < 39:
+        mode = "flat"
+
+    if mode == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif mode == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = DEFAULT_EF_SEARCH
+    else:
+        nlist = _ivf_nlist(n)
+        quantizer = faiss.IndexFlatIP(dim)
+        if mode == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_subquantizers(dim), 8,
+                                     faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+        index.nprobe = min(DEFAULT_NPROBE, nlist)
+    if ids is not None:
+        if mode in ("flat", "hnsw"):
+            index = faiss.IndexIDMap2(index)
+        index.add_with_ids(embeddings, np.asarray(ids, dtype='int64'))
+    else:
+        index.add(embeddings)
     return index, dim
 
-def search_index(index: faiss.IndexFlatIP, query_emb: np.ndarray, top_k: int = 5):
+@timed("ingest_pages")
+def ingest_pages(pages: Iterable[str], chunk_size: int = 800, overlap: int = 150,
+                 batch_size: int = EMBED_BATCH_SIZE, index: Optional[faiss.Index] = None,
+                 store: Optional[ChunkStore] = None, doc_name: str = "document",
+                 bm25: Optional[BM25Index] = None,
+                 progress_callback: Optional[Callable[[int, int], None]] = None):
+    """Stream pages -> chunks -> embeddings -> index in fixed-size batches.
+
+    Page text is stored once in `store` and chunks are recorded as offsets. Only one
+    batch of chunk texts/embeddings is alive at a time. `index` and `store` grow
+    together, so whatever has been ingested so far is already searchable. If `bm25`
+    is given, each batch is also added to that lexical index.
+    `progress_callback(pages_done, chunks_done)` is called after every batch.
+    Returns (index, store); index is None if the pages held no text.
+    """
+    store = ChunkStore() if store is None else store
+    doc_id = store.add_document(doc_name)
+    pages_done = 0
+
+    def counted(src):
+        nonlocal pages_done
+        for page in src:
+            pages_done += 1
+            yield page
+
+    spans = iter_chunk_spans(store.iter_add_pages(doc_id, counted(pages)), chunk_size, overlap)
+    for batch in iter_batches(spans, batch_size):
+        texts = [store.slice(doc_id, start, end) for start, end, _ in batch]
+        emb = embed_texts(texts)
+        if bm25 is not None:
+            bm25.add(texts)
+        faiss.normalize_L2(emb)
+        if index is None:
+            index = faiss.IndexFlatIP(emb.shape[1])
+        index.add(emb)
+        for start, end, own_start in batch:
+            store.add_chunk(doc_id, start, end, own_start)
+        if progress_callback:
+            progress_callback(pages_done, len(store))
+    flush_embedding_cache()
+    return index, store
+
+def index_vectors(index: faiss.Index) -> np.ndarray:
+    """All vectors of a flat index (stored per-document indexes are always flat)"""
+    return index.reconstruct_n(0, index.ntotal)
+
+@timed("merge_indexes")
+def merge_indexes(indexes: List[faiss.Index], mode: str = "flat") -> faiss.Index:
+    """Combine per-document flat indexes into one index of the requested type, built with ids.
+
+    Vector i of the concatenation gets id i (its chunk id), so documents can later be
+    appended with add_to_index and dropped with remove_from_index.
+    """
+    vectors = np.vstack([index_vectors(idx) for idx in indexes if idx.ntotal])
+    merged, _ = build_faiss_index(vectors, mode, ids=np.arange(len(vectors)))
+    return merged
+
+def add_to_index(index: faiss.Index, vectors: np.ndarray, first_id: int):
+    """Append vectors to an index built with ids as ids first_id, first_id + 1, ..."""
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    faiss.normalize_L2(vectors)
+    index.add_with_ids(vectors, np.arange(first_id, first_id + len(vectors), dtype='int64'))
+
+def remove_from_index(index: faiss.Index, ids: List[int], mode: str = "flat") -> Optional[faiss.Index]:
+    """Drop ids from an index built with ids; returns the index to use from now on (None if empty)"""
+    ids = np.asarray(ids, dtype='int64')
+    try:
+        index.remove_ids(ids)
+        return index if index.ntotal else None
+    except RuntimeError:
+        # HNSW graphs cannot delete nodes: rebuild from the vectors that remain
+        keep = np.setdiff1d(faiss.vector_to_array(index.id_map), ids)
+        if not keep.size:
+            return None
+        vectors = np.vstack([index.reconstruct(int(i)) for i in keep])
+        rebuilt, _ = build_faiss_index(vectors, mode, ids=keep)
+        return rebuilt
+
+def _base_index(index: faiss.Index) -> faiss.Index:
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+def _search_params(index: faiss.Index, nprobe: Optional[int], ef_search: Optional[int]):
+    # Per-call parameters leave the (possibly shared) index untouched
+    if nprobe and faiss.try_extract_index_ivf(index) is not None:
+        return faiss.SearchParametersIVF(nprobe=int(nprobe))
+    if ef_search and isinstance(_base_index(index), faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search))
+    return None
+
+def search_index(index: faiss.Index, query_emb: np.ndarray, top_k: int = 5,
+                 nprobe: Optional[int] = None, ef_search: Optional[int] = None):
     faiss.normalize_L2(query_emb)
-    scores, indices = index.search(query_emb, top_k)
+    params = _search_params(index, nprobe, ef_search)
+    if params is None:
+        scores, indices = index.search(query_emb, top_k)
+    else:
+        scores, indices = index.search(query_emb, top_k, params=params)
     return scores[0], indices[0]
 
-def retrieve_top_k(query: str, docs: List[str], index: faiss.IndexFlatIP, top_k: int = 5):
-    model = get_embedding_model()
-    q_emb = model.encode([query], convert_to_numpy=True).astype('float32')
-    scores, ids = search_index(index, q_emb, top_k=top_k)
+@timed("encode_queries")
+def encode_queries(queries: List[str], use_cache: bool = True) -> np.ndarray:
+    """Query embeddings (not normalized), served from the query cache when asked before"""
+    if not use_cache:
+        model = get_embedding_model()
+        return model.encode(queries, convert_to_numpy=True).astype('float32')
+
+    # Re-asked questions ("What is the Hemoglobin value?") skip the encoder entirely
+    cache = get_query_cache()
+    keys = [normalize_query(q) for q in queries]
+    vectors = [cache.get(k) for k in keys]
+    missing = list(dict.fromkeys(k for k, v in zip(keys, vectors) if v is None))
+    incr("query_cache_misses", len(missing))
+    incr("query_cache_hits", len(keys) - len(missing))
+    if missing:
+        model = get_embedding_model()
+        first = {}
+        for k, q in zip(keys, queries):
+            first.setdefault(k, q)
+        emb = model.encode([first[k] for k in missing], convert_to_numpy=True).astype('float32')
+        for k, vec in zip(missing, emb):
+            cache.put(k, vec)
+        fresh = dict(zip(missing, emb))
+        vectors = [v if v is not None else fresh[k] for k, v in zip(keys, vectors)]
+    return np.vstack(vectors).astype('float32')
+
+def _format_results(docs, scores: np.ndarray, ids: np.ndarray) -> List[dict]:
     results = []
     for s, i in zip(scores, ids):
         if i < 0 or i >= len(docs):
             continue
-        results.append({
+        if isinstance(docs, ChunkStore) and not docs.is_live(int(i)):
+            continue  # chunk of a removed document
+        result = {
             'chunk': docs[int(i)],
             'score': float(s),
             'id': int(i)
-        })
+        }
+        if isinstance(docs, ChunkStore):
+            result.update(docs.meta(int(i)))
+        results.append(result)
     return results
 
+def _fuse(dense: List[dict], lexical: List[dict], alpha: float, top_k: int) -> List[dict]:
+    """Weighted sum of max-normalized dense and BM25 scores (a missing score counts as 0)"""
+    def normalized(results):
+        top = max((r['score'] for r in results), default=0.0)
+        return {r['id']: (r['score'] / top if top > 0 else 0.0) for r in results}
 
+    dense_n, lexical_n = normalized(dense), normalized(lexical)
+    merged = {r['id']: dict(r) for r in lexical}
+    merged.update({r['id']: dict(r) for r in dense})
+    for i, r in merged.items():
+        r['dense_score'] = dense_n.get(i, 0.0)
+        r['bm25_score'] = lexical_n.get(i, 0.0)
+        r['score'] = alpha * r['dense_score'] + (1 - alpha) * r['bm25_score']
+    return sorted(merged.values(), key=lambda r: r['score'], reverse=True)[:top_k]
 
+def _check_mode(mode: str, bm25: Optional[BM25Index]):
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {mode!r} (expected one of {RETRIEVAL_MODES})")
+    if mode != "dense" and bm25 is None:
+        raise ValueError(f"Retrieval mode {mode!r} needs a BM25 index")
 
+@timed("retrieve_top_k")
+def retrieve_top_k(query: str, docs: List[str], index: Optional[faiss.Index], top_k: int = 5,
+                   nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                   mode: str = "dense", bm25: Optional[BM25Index] = None,
+                   alpha: float = HYBRID_ALPHA):
+    """mode: "dense" (FAISS), "bm25" (lexical only, no embedding model) or "hybrid" (both, fused)"""
+    _check_mode(mode, bm25)
+    if mode == "bm25":
+        return _format_results(docs, *bm25.search(query, top_k))
 
+    n_candidates = top_k * HYBRID_CANDIDATES if mode == "hybrid" else top_k
+    q_emb = encode_queries([query])
+    scores, ids = search_index(index, q_emb, top_k=n_candidates, nprobe=nprobe, ef_search=ef_search)
+    dense = _format_results(docs, scores, ids)
+    if mode == "dense":
+        return dense
+    return _fuse(dense, _format_results(docs, *bm25.search(query, n_candidates)), alpha, top_k)
 
+@timed("retrieve_top_k_batch")
+def retrieve_top_k_batch(queries: List[str], docs: List[str], index: Optional[faiss.Index], top_k: int = 5,
+                         nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                         mode: str = "dense", bm25: Optional[BM25Index] = None,
+                         alpha: float = HYBRID_ALPHA) -> List[List[dict]]:
+    """retrieve_top_k for many queries: one encoder forward pass and one FAISS search.
 
+    Duplicate queries are encoded and searched once and share their results.
+    Returns one result list per query, in input order, shaped like retrieve_top_k.
+    """
+    _check_mode(mode, bm25)
+    if not queries:
+        return []
+    unique = list(dict.fromkeys(queries))
+    if mode == "bm25":
+        by_query = {q: _format_results(docs, *bm25.search(q, top_k)) for q in unique}
+        return [list(by_query[q]) for q in queries]
 
-
-
-
-
-
-
-
-
-
+    n_candidates = top_k * HYBRID_CANDIDATES if mode == "hybrid" else top_k
+    q_emb = encode_queries(unique)
+    faiss.normalize_L2(q_emb)
+    params = _search_params(index, nprobe, ef_search)
+    if params is None:
+        scores, ids = index.search(q_emb, n_candidates)
+    else:
+        scores, ids = index.search(q_emb, n_candidates, params=params)
+    by_query = {q: _format_results(docs, scores[row], ids[row]) for row, q in enumerate(unique)}
+    if mode == "hybrid":
+        by_query = {q: _fuse(dense, _format_results(docs, *bm25.search(q, n_candidates)), alpha, top_k)
+                    for q, dense in by_query.items()}
+    return [list(by_query[q]) for q in queries]
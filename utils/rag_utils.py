@@ -1,62 +1,190 @@
 
 # utils/rag_utils.py
 import streamlit as st
-import os, json
-from groq import Groq
-from utils.rag_pdf_utils import load_pdf_bytes, simple_text_split, embed_texts, build_faiss_index, retrieve_top_k
+import os, json, time
+import faiss
+from utils.llm_gateway import get_llm_gateway
+from utils.rag_pdf_utils import (
+    EMBEDDING_MODEL_NAME, PDF_EXTRACT_WORKERS, INDEX_MODES, ANN_AUTO_THRESHOLD, DEFAULT_NPROBE,
+    DEFAULT_EF_SEARCH, RETRIEVAL_MODES, HYBRID_ALPHA, count_pdf_pages, extract_pages_parallel,
+    iter_pdf_pages, ingest_pages, merge_indexes, add_to_index, remove_from_index, index_vectors, retrieve_top_k
+)
+from utils.chunk_store import ChunkStore
+from utils.bm25_index import BM25Index
+from utils.query_cache import get_query_cache
+from utils.index_store import content_key, has_index, load_index, save_index, delete_index
+from utils.index_registry import get_index_registry, registry_key
+from utils.db import (
+    add_document, get_document_by_hash, save_rag_history, get_rag_history, clear_rag_history, get_ingest_jobs
+)
+from utils.ingest_worker import BACKGROUND_INGEST, POLL_SECONDS, submit_upload, ensure_workers
+from utils.llm_utils import CompletionStream, format_timing
 
 # ================================
-#  File to Store Persistent History
+#  Persistent History (SQLite `rag_history`)
 # ================================
-HISTORY_FILE = "data/rag_history.json"
+# data/rag_history.json is no longer read; import it once with migrate_rag_history.py
+HISTORY_PAGE_SIZE = 20
 
 
 # ================================
-#  Load / Save Persistent History
+#  Index Building / Session Handle
 # ================================
-def save_history(username, query, answer):
-    """Save question-answer pair to rag_history.json for a user"""
-    if not os.path.exists(HISTORY_FILE):
-        os.makedirs(os.path.dirname(HISTORY_FILE), exist_ok=True)
-        with open(HISTORY_FILE, "w") as f:
-            json.dump({}, f)
-
-    with open(HISTORY_FILE, "r") as f:
-        try:
-            data = json.load(f)
-        except json.JSONDecodeError:
-            data = {}
-
-    if username not in data:
-        data[username] = []
-    data[username].append({"query": query, "answer": answer})
-
-    with open(HISTORY_FILE, "w") as f:
-        json.dump(data, f, indent=4)
-
-
-def load_history(username):
-    """Load user history from rag_history.json"""
-    if not os.path.exists(HISTORY_FILE):
-        return []
-    with open(HISTORY_FILE, "r") as f:
-        try:
-            data = json.load(f)
-        except json.JSONDecodeError:
-            data = {}
-    return data.get(username, [])
-
-
-def delete_history(username):
-    """Delete user history"""
-    if not os.path.exists(HISTORY_FILE):
-        return
-    with open(HISTORY_FILE, "r") as f:
-        data = json.load(f)
-    if username in data:
-        del data[username]
-    with open(HISTORY_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+def _extract_pending(uploads, stored, workers):
+    """With several workers, extract every file that has no stored index at once so
+    uploads spread across cores; otherwise pages are streamed lazily into the chunker"""
+    pending = [i for i, entry in enumerate(stored) if entry is None and uploads[i][1] is not None]
+    if workers > 1 and pending:
+        return dict(zip(pending, extract_pages_parallel([uploads[i][1] for i in pending], max_workers=workers)))
+    return {}
+
+
+def _load_or_ingest(name, file_bytes, key, stored, pages, chunk_size, overlap, bm25):
+    """(flat index, store) for one upload, appending its chunks to `bm25`; None if it has no text"""
+    if stored is not None:
+        index, store = stored
+        bm25.add(store)
+        st.success(f"⚡ Loaded stored index for: {name}")
+    elif file_bytes is None:
+        # Background ingestion finished, but its stored index cannot be read back (and the
+        # upload is gone): drop the entry so processing the file again queues a new job
+        delete_index(key)
+        st.error(f"❌ Could not load the processed index for {name}; please process it again.")
+        return None
+    else:
+        # STEP 2: Stream pages -> chunks -> embeddings -> index in batches
+        if pages is not None:
+            total_pages = len(pages)
+        else:
+            pages, total_pages = iter_pdf_pages(file_bytes), count_pdf_pages(file_bytes)
+        progress = st.progress(0.0, text=f"⏳ Processing {name}...")
+
+        def report(pages_done, chunks_done):
+            progress.progress(min(pages_done / max(total_pages, 1), 1.0),
+                              text=f"⏳ {name}: {pages_done}/{total_pages} pages, {chunks_done} chunks embedded")
+
+        index, store = ingest_pages(pages, chunk_size, overlap, doc_name=name, bm25=bm25,
+                                    progress_callback=report)
+        progress.empty()
+        if index is None:
+            st.warning(f"⚠️ No text found in {name}")
+            return None
+        st.success(f"✅ Extracted text from: {name}")
+
+        path = save_index(key, index, store)
+        if get_document_by_hash(key) is None:
+            add_document(st.session_state.username, name, key, chunk_size, overlap,
+                         EMBEDDING_MODEL_NAME, len(store), path)
+
+    store.doc_keys[0] = key  # per-file stores hold exactly one document
+    st.info(f"📄 {len(store)} chunks created from {name}")
+    return index, store
+
+
+def _build_index(uploads, keys, chunk_size, overlap, workers, index_mode):
+    """Load or ingest every upload and combine them; returns (index, docs, bm25) or None"""
+    stores = []
+    indexes = []
+    bm25 = BM25Index()  # lexical index over the same chunk order as the FAISS index
+
+    # Reuse previously built indexes for identical bytes + settings
+    stored = [load_index(key) for key in keys]
+    extracted = _extract_pending(uploads, stored, workers)
+
+    for i, (name, file_bytes) in enumerate(uploads):
+        built = _load_or_ingest(name, file_bytes, keys[i], stored[i], extracted.get(i),
+                                chunk_size, overlap, bm25)
+        if built is not None:
+            indexes.append(built[0])
+            stores.append(built[1])
+
+    if not indexes:
+        return None
+    return merge_indexes(indexes, index_mode), ChunkStore.merge(stores), bm25
+
+
+def _add_documents(handle, uploads, keys, chunk_size, overlap, workers):
+    """Copy of the session's index with `uploads` appended; only files never seen before are embedded"""
+    # Copy-on-write: other sessions may share the current entry
+    index = faiss.clone_index(handle.index)
+    docs = handle.docs.copy()
+    bm25 = handle.bm25.copy()
+
+    stored = [load_index(key) for key in keys]
+    extracted = _extract_pending(uploads, stored, workers)
+    for i, (name, file_bytes) in enumerate(uploads):
+        built = _load_or_ingest(name, file_bytes, keys[i], stored[i], extracted.get(i),
+                                chunk_size, overlap, bm25)
+        if built is not None:
+            first_id = docs.extend(built[1])
+            add_to_index(index, index_vectors(built[0]), first_id)
+    return index, docs, bm25
+
+
+def _remove_document(handle, doc_id, index_mode):
+    """Copy of the session's index without one document; None if nothing would be left"""
+    docs = handle.docs.copy()
+    ids = docs.remove_document(doc_id)
+    bm25 = handle.bm25.copy()
+    bm25.remove(ids)
+    index = remove_from_index(faiss.clone_index(handle.index), ids, index_mode)
+    if index is None:
+        return None
+    return index, docs, bm25
+
+
+def _set_index_handle(handle):
+    """Point this session at a shared registry entry (or None), releasing the previous one"""
+    old = st.session_state.get("rag_index")
+    if old is not None and old is not handle:
+        old.release()
+    st.session_state.rag_index = handle
+
+
+def _index_uploads(uploads, keys, settings, workers):
+    """Point the session at an index over `uploads`, appending to the current one when the settings match"""
+    registry = get_index_registry()
+    chunk_size, overlap, index_mode = settings
+    current = st.session_state.get("rag_index")
+    built_here = []  # set if this run built the entry instead of reusing another session's
+
+    def builder(build, *args):
+        # registry.acquire calls this at most once per key; concurrent sessions wait and share
+        def run():
+            built_here.append(True)
+            return build(*args)
+        return run
+
+    if current is not None and st.session_state.get("rag_index_settings") == settings:
+        # Append only the files this index does not hold yet
+        live_keys = current.docs.live_keys()
+        new = {k: u for u, k in zip(uploads, keys) if k not in live_keys}
+        if not new:
+            st.info("ℹ️ All uploaded files are already in the index")
+            handle = current
+        else:
+            shared_key = registry_key(live_keys + list(new), index_mode)
+            handle = registry.acquire(shared_key, builder(_add_documents, current, list(new.values()), list(new),
+                                                          chunk_size, overlap, workers))
+    else:
+        # Another session may already hold (or be building) an index for exactly these documents + settings
+        shared_key = registry_key(keys, index_mode)
+        handle = registry.acquire(shared_key, builder(_build_index, uploads, keys, chunk_size, overlap, workers,
+                                                      index_mode))
+    if handle is not None and handle is not current and not built_here:
+        st.success("⚡ Reusing an index already loaded for these documents")
+
+    if handle is not None:
+        _set_index_handle(handle)
+        st.session_state.rag_index_settings = settings
+
+        # Reset conversation buffer after new PDF processing
+        st.session_state.rag_history_buffer = []
+
+        n_chunks = sum(n for _, _, n in handle.docs.documents())
+        st.success(f"✅ Index built successfully with {n_chunks} chunks!")
+    else:
+        st.error("❌ None of the uploaded PDFs could be indexed.")
 
 
 # ================================
@@ -76,56 +204,112 @@ def rag_reader_page():
     # =============================
     chunk_size = st.number_input("Chunk Size", min_value=100, max_value=5000, value=1000, step=100)
     overlap = st.number_input("Chunk Overlap", min_value=0, max_value=chunk_size-1, value=200, step=50)
+    workers = 1
+    if not BACKGROUND_INGEST:  # background jobs run on the fixed INGEST_WORKERS x INGEST_THREADS budget
+        workers = st.number_input("Extraction Workers", min_value=1, max_value=64,
+                                  value=min(PDF_EXTRACT_WORKERS, 64), step=1)
+    with st.expander("⚙️ Index & Search Settings"):
+        index_mode = st.selectbox("Index Type", INDEX_MODES, index=0,
+                                  help=f"auto = exact Flat below {ANN_AUTO_THRESHOLD:,} chunks, approximate (ANN) above")
+        nprobe = st.number_input("IVF nprobe", min_value=1, max_value=1024, value=DEFAULT_NPROBE, step=1)
+        ef_search = st.number_input("HNSW efSearch", min_value=1, max_value=2048, value=DEFAULT_EF_SEARCH, step=8)
+        retrieval_mode = st.selectbox("Retrieval Mode", RETRIEVAL_MODES, index=0,
+                                      help="dense = semantic (FAISS), bm25 = exact keywords/lab codes, hybrid = both")
+        alpha = st.slider("Hybrid dense weight", min_value=0.0, max_value=1.0, value=HYBRID_ALPHA, step=0.05)
     uploaded_files = st.file_uploader("📎 Upload PDF Files", type=["pdf"], accept_multiple_files=True)
 
     if st.button("🛠️ Process PDFs"):
         if uploaded_files:
-            all_texts = []
-            for f in uploaded_files:
-                pdf_text = load_pdf_bytes(f.read())
-                st.success(f"✅ Extracted text from: {f.name}")
-                chunks = simple_text_split(pdf_text, chunk_size, overlap)
-                st.info(f"📄 {len(chunks)} chunks created from {f.name}")
-                all_texts += chunks
-
-            # STEP 2: Create Embeddings
-            embeddings = embed_texts(all_texts)
-            index, dim = build_faiss_index(embeddings)
-
-            st.session_state.docs = all_texts
-            st.session_state.index = index
-            st.session_state.built = True
-
-            # Reset conversation buffer after new PDF processing
-            st.session_state.rag_history_buffer = []
-
-            st.success(f"✅ Index built successfully with {len(all_texts)} chunks!")
+            uploads = [(f.name, f.read()) for f in uploaded_files]
+            keys = [content_key(data, chunk_size, overlap, EMBEDDING_MODEL_NAME) for _, data in uploads]
+
+            settings = (chunk_size, overlap, index_mode)
+            if BACKGROUND_INGEST:
+                # Queue files without a stored index; the index is built once their jobs finish
+                job_ids = sorted({submit_upload(st.session_state.username, name, data, key, chunk_size, overlap,
+                                                EMBEDDING_MODEL_NAME)
+                                  for (name, data), key in zip(uploads, keys) if not has_index(key)})
+                st.session_state.rag_pending = {"jobs": job_ids, "uploads": [(name, key) for (name, _), key
+                                                                             in zip(uploads, keys)],
+                                                "settings": settings}
+                if job_ids:
+                    ensure_workers()
+            else:
+                _index_uploads(uploads, keys, settings, int(workers))
         else:
             st.error("❌ Please upload at least one PDF.")
 
+    # Background ingestion: show job progress and build the index once every job is done
+    pending = st.session_state.get("rag_pending")
+    if pending is not None:
+        jobs = get_ingest_jobs(pending["jobs"])
+        active = [job for job in jobs if job["status"] in ("queued", "running")]
+        for job in active:
+            if job["status"] == "queued":
+                st.progress(0.0, text=f"🕒 {job['filename']}: waiting for a worker...")
+            else:
+                total = job["total_pages"] or 0
+                st.progress(min(job["pages_done"] / max(total, 1), 1.0),
+                            text=f"⏳ {job['filename']}: {job['pages_done']}/{total} pages, "
+                                 f"{job['num_chunks'] or 0} chunks embedded")
+        if not active:
+            del st.session_state.rag_pending
+            for job in jobs:
+                if job["status"] == "failed":
+                    st.error(f"❌ Could not process {job['filename']}: {job['error']}")
+            # Every finished file now has a stored index, so its bytes are not needed again
+            ready = [(name, key) for name, key in pending["uploads"] if has_index(key)]
+            if ready:
+                _index_uploads([(name, None) for name, _ in ready], [key for _, key in ready],
+                               pending["settings"], 1)
+            elif not any(job["status"] == "failed" for job in jobs):
+                st.error("❌ No text could be extracted from the uploaded PDFs.")
+        else:
+            ensure_workers()  # restarts a worker that died
+
     # =============================
     # STEP 2.5: Clear Index
     # =============================
     if st.button("🧹 Clear Index"):
-        st.session_state.docs = None
-        st.session_state.index = None
-        st.session_state.built = False
+        _set_index_handle(None)
         st.session_state.rag_history_buffer = []
         st.success("🧽 Index cleared successfully.")
 
     # =============================
     # STEP 3: Ask Questions with Memory
     # =============================
-    if st.session_state.get("built"):
+    handle = st.session_state.get("rag_index")
+    if handle is not None:
+        # Per-document chunk counts; removing one drops only its chunks
+        st.markdown("### 📚 Indexed Documents")
+        for doc_id, name, n_chunks in handle.docs.documents():
+            col_name, col_remove = st.columns([5, 1])
+            col_name.write(f"📄 {name} — {n_chunks} chunks")
+            if col_remove.button("🗑️ Remove", key=f"remove_doc_{handle.key[:12]}_{doc_id}"):
+                built_mode = st.session_state.get("rag_index_settings", (None, None, index_mode))[2]
+                remaining = _remove_document(handle, doc_id, built_mode)
+                if remaining is None:
+                    _set_index_handle(None)
+                else:
+                    shared_key = registry_key(remaining[1].live_keys(), built_mode)
+                    _set_index_handle(get_index_registry().put(shared_key, *remaining))
+                st.session_state.rag_history_buffer = []
+                st.rerun()
+
         st.markdown("### 💬 Ask Questions Based on Uploaded Documents")
         query = st.text_input("Your question:")
 
         if st.button("Ask") and query.strip():
             # STEP 4: Retrieve Top Matches
             st.info("🔍 Retrieving top relevant chunks...")
-            results = retrieve_top_k(query, st.session_state.docs, st.session_state.index)
+            results = retrieve_top_k(query, handle.docs, handle.index,
+                                     nprobe=int(nprobe), ef_search=int(ef_search),
+                                     mode=retrieval_mode, bm25=handle.bm25, alpha=alpha)
             context = "\n\n".join([r["chunk"] for r in results])
             st.success(f"✅ Retrieved {len(results)} relevant chunks")
+            sources = sorted({f"{r['doc']} p.{r['page']}" for r in results if "doc" in r})
+            if sources:
+                st.caption("📑 Sources: " + ", ".join(sources))
 
             # STEP 5: Send Context + Conversation History + Question to LLM
             st.info("🧠 Sending context and conversation to LLM...")
@@ -135,29 +319,33 @@ def rag_reader_page():
             Always provide clear, structured, and safe medical explanations.
             If the answer is not in the context, say so politely."""
 
-            client = Groq(api_key=os.getenv("GROQ_API_KEY", st.secrets.get("GROQ_API_KEY")))
+            client = get_llm_gateway(os.getenv("GROQ_API_KEY", st.secrets.get("GROQ_API_KEY")))
 
             # Combine system message + previous messages + new query
             messages = [{"role": "system", "content": SYSTEM_PROMPT}] + st.session_state.rag_history_buffer + [
                 {"role": "user", "content": f"Context:\n{context}\n\nQuestion:\n{query}"}
             ]
 
-            resp = client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=messages
-            )
-            answer = resp.choices[0].message.content.strip()
-
-            # STEP 6: Display answer
+            # STEP 6: Stream the answer as it is generated
             st.subheader("🩺 Answer")
-            st.success(answer)
+            stream = CompletionStream(client, model="llama-3.1-8b-instant", messages=messages)
+            st.write_stream(stream)
+            answer = stream.text
+            st.caption(format_timing(stream.timing()))
 
             # STEP 7: Update conversation buffer
             st.session_state.rag_history_buffer.append({"role": "user", "content": query})
             st.session_state.rag_history_buffer.append({"role": "assistant", "content": answer})
 
             # STEP 8: Save persistent history (per user)
-            save_history(st.session_state.username, query, answer)
+            save_rag_history(st.session_state.username, query, answer)
+
+    stats = get_query_cache().stats()
+    st.sidebar.caption(f"🧠 Query cache: {stats['hits']} hits / {stats['misses']} misses "
+                       f"({stats['hit_rate']:.0%}), {stats['entries']} cached")
+    reg = get_index_registry().stats()
+    st.sidebar.caption(f"🗂️ Shared indexes: {reg['entries']} loaded ({reg['in_use']} in use), "
+                       f"{reg['bytes'] / 2**20:.1f} / {reg['budget_bytes'] / 2**20:.0f} MB")
 
     # =============================
     # STEP 4: Show Current Conversation
@@ -180,46 +368,42 @@ def rag_reader_page():
     # STEP 5: Show Persistent History
     # =============================
     st.subheader("📜 Previous Questions & Answers")
-    history = load_history(st.session_state.username)
+    if "rag_history_limit" not in st.session_state:
+        st.session_state.rag_history_limit = HISTORY_PAGE_SIZE
+    limit = st.session_state.rag_history_limit
+    history = get_rag_history(st.session_state.username, limit=limit + 1)  # one extra: is there more?
     if history:
-        for entry in reversed(history):
+        for entry in history[:limit]:
             st.markdown(f"**❓ Q:** {entry['query']}")
             st.markdown(f"**💬 A:** {entry['answer']}")
+        if len(history) > limit and st.button("⬇️ Load more"):
+            st.session_state.rag_history_limit += HISTORY_PAGE_SIZE
+            st.rerun()
     else:
         st.info("No previous questions yet.")
 
-    # Download persistent history
-    if history:
+    # Download persistent history (the full history is only read when asked for)
+    if history and st.button("📤 Export History"):
+        full = [{"query": r["query"], "answer": r["answer"], "timestamp": r["timestamp"]}
+                for r in reversed(get_rag_history(st.session_state.username))]
         st.download_button(
             label="📥 Download History",
-            data=json.dumps(history, indent=4),
+            data=json.dumps(full, indent=4),
             file_name="rag_history.json",
             mime="application/json"
         )
 
     # Delete persistent history
     if history and st.button("🗑️ Delete History"):
-        delete_history(st.session_state.username)
+        clear_rag_history(st.session_state.username)
         st.success("History deleted successfully.")
         st.session_state.page = "rag"
         st.session_state.rag_history_buffer = []
+        st.session_state.rag_history_limit = HISTORY_PAGE_SIZE
         st.success("Conversation cleared.")
         st.rerun()
-        st.rerun()
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
 
+    # Poll running ingestion jobs after the rest of the page has rendered
+    if st.session_state.get("rag_pending") is not None:
+        time.sleep(POLL_SECONDS)
+        st.rerun()
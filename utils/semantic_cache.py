@@ -0,0 +1,153 @@
+# utils/semantic_cache.py
+import os
+import re
+import time
+import hashlib
+import threading
+from typing import Optional
+import numpy as np
+import faiss
+from utils.metrics import incr, timed
+from utils.query_cache import normalize_query
+from utils.rag_pdf_utils import EMBEDDING_MODEL_NAME, encode_queries
+from utils.db import (
+    add_semantic_cache_entry, get_semantic_cache_entries, record_semantic_cache_hit,
+    delete_semantic_cache_entries, purge_semantic_cache
+)
+
+# ================================
+#  Semantic answer cache for the chatbot
+# ================================
+# Standalone questions ("what is a sphygmomanometer") are embedded with the RAG
+# embedding model and matched against past questions by cosine similarity. Entries
+# live in SQLite (`semantic_cache`) so they survive restarts and are shared by every
+# process; each process keeps a FAISS IndexIDMap over them for lookup. A scope
+# (chat model + system prompt) keeps answers from one prompt out of another's cache.
+SEMANTIC_CACHE_ENABLED = os.getenv("SMARTAI_SEMANTIC_CACHE", "1") != "0"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+SEMANTIC_CACHE_TTL_HOURS = float(os.getenv("SEMANTIC_CACHE_TTL_HOURS", 24 * 7))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 5000))
+
+# Questions that lean on earlier turns or ask for a particular output format are never cached
+_CONTEXT_DEPENDENT = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|their|above|previous|earlier|same|again|else|instead|"
+    r"json|table|yaml|csv|bullets?|list|format|short|shorter|brief|detailed|longer)\b"
+)
+
+
+def cache_scope(*parts) -> str:
+    h = hashlib.sha256(EMBEDDING_MODEL_NAME.encode("utf-8"))
+    for part in parts:
+        h.update(b"\0")
+        h.update(str(part).encode("utf-8"))
+    return h.hexdigest()[:32]
+
+
+def is_standalone(question: str, prior_turns) -> bool:
+    """True for a first turn whose wording does not depend on context"""
+    return not prior_turns and not _CONTEXT_DEPENDENT.search(normalize_query(question))
+
+
+class SemanticCache:
+    def __init__(self, scope: str, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 ttl_hours: float = SEMANTIC_CACHE_TTL_HOURS, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        self.scope = scope
+        self.threshold = threshold
+        self.ttl = ttl_hours * 3600
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = None
+        self._entries = {}  # id -> (answer, created_at), oldest first
+
+    def _embed(self, question: str) -> np.ndarray:
+        vec = np.ascontiguousarray(encode_queries([question]), dtype="float32")
+        faiss.normalize_L2(vec)
+        return vec
+
+    def _load_locked(self, dim: int):
+        self._index = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+        rows = get_semantic_cache_entries(self.scope, time.time() - self.ttl)
+        if rows:
+            vectors = np.vstack([np.frombuffer(r["embedding"], dtype="float32") for r in rows])
+            self._index.add_with_ids(vectors, np.array([r["id"] for r in rows], dtype="int64"))
+            self._entries = {r["id"]: (r["answer"], r["created_at"]) for r in rows}
+
+    @timed("semantic_cache_lookup")
+    def lookup(self, question: str) -> Optional[str]:
+        """Cached answer for a question similar enough to a past one, else None"""
+        vec = self._embed(question)
+        with self._lock:
+            if self._index is None:
+                self._load_locked(vec.shape[1])
+            answer = None
+            if self._index.ntotal:
+                scores, ids = self._index.search(vec, 1)
+                entry = self._entries.get(int(ids[0][0]))
+                if scores[0][0] >= self.threshold and entry is not None:
+                    if entry[1] > time.time() - self.ttl:
+                        answer = entry[0]
+                    else:
+                        self._evict_locked()
+            if answer is None:
+                self.misses += 1
+                incr("semantic_cache_misses")
+                return None
+            self.hits += 1
+        incr("semantic_cache_hits")
+        record_semantic_cache_hit(int(ids[0][0]))
+        return answer
+
+    def store(self, question: str, answer: str):
+        vec = self._embed(question)
+        now = time.time()
+        entry_id = add_semantic_cache_entry(self.scope, normalize_query(question), vec.tobytes(), answer, now)
+        with self._lock:
+            if self._index is None:
+                self._load_locked(vec.shape[1])  # picks up the row just inserted
+            else:
+                self._index.add_with_ids(vec, np.array([entry_id], dtype="int64"))
+                self._entries[entry_id] = (answer, now)
+            self._evict_locked()
+
+    def _evict_locked(self):
+        cutoff = time.time() - self.ttl
+        expired = [i for i, (_, created) in self._entries.items() if created <= cutoff]
+        overflow = max(len(self._entries) - len(expired) - self.max_entries, 0)
+        skip = set(expired)
+        oldest = [i for i in self._entries if i not in skip][:overflow]
+        if not expired and not oldest:
+            return
+        drop = expired + oldest
+        self._index.remove_ids(np.array(drop, dtype="int64"))
+        for i in drop:
+            del self._entries[i]
+        if expired:
+            purge_semantic_cache(self.scope, cutoff)
+        if oldest:
+            delete_semantic_cache_entries(oldest)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_semantic_cache(scope: str) -> SemanticCache:
+    cache = _caches.get(scope)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(scope)
+            if cache is None:
+                cache = _caches[scope] = SemanticCache(scope)
+    return cache
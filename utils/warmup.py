@@ -0,0 +1,42 @@
+# utils/warmup.py
+import os
+import threading
+import traceback
+
+# ================================
+#  Background model warm-up
+# ================================
+# Loading all-MiniLM (and torch behind it) takes seconds. After login we start it on a
+# daemon thread so the RAG page usually finds the model ready. Set SMARTAI_WARMUP=0 to disable.
+WARMUP_ENABLED = os.getenv("SMARTAI_WARMUP", "1") != "0"
+
+_started = False
+_lock = threading.Lock()
+_done = threading.Event()
+
+
+def _warm():
+    try:
+        from utils.rag_pdf_utils import get_embedding_model
+        get_embedding_model()
+    except Exception:
+        traceback.print_exc()
+    finally:
+        _done.set()
+
+
+def start_warmup() -> bool:
+    """Start the warm-up thread once per process; returns True if it was started by this call"""
+    global _started
+    if not WARMUP_ENABLED:
+        return False
+    with _lock:
+        if _started:
+            return False
+        _started = True
+    threading.Thread(target=_warm, name="model-warmup", daemon=True).start()
+    return True
+
+
+def wait_for_warmup(timeout=None) -> bool:
+    return _done.wait(timeout)